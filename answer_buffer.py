@@ -0,0 +1,119 @@
+import atexit
+import os
+import sqlite3
+import threading
+
+from db import open_connection
+
+# How long a submitted answer may sit in memory before it is committed, and
+# how many buffered answers force an early flush. An interval of 0 disables
+# buffering and writes every answer from the request thread.
+FLUSH_INTERVAL_MS = int(os.environ.get("ANSWER_FLUSH_INTERVAL_MS", "5"))
+FLUSH_MAX_ROWS = int(os.environ.get("ANSWER_FLUSH_MAX_ROWS", "200"))
+
+INSERT_RESPONSE = (
+    "INSERT INTO responses (game_pin, question_id, participant, answer, is_correct) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+
+
+class AnswerBuffer:
+    """Write-behind buffer that group-commits answers from concurrent requests.
+
+    submit_answer appends a row and returns immediately; a background thread
+    writes everything collected so far in a single transaction every
+    FLUSH_INTERVAL_MS (or as soon as FLUSH_MAX_ROWS are waiting), so a burst
+    of N answers costs one fsync instead of N.
+    """
+
+    def __init__(self, flush_interval_ms=FLUSH_INTERVAL_MS, max_rows=FLUSH_MAX_ROWS):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_rows = max_rows
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        # Own connection, used under _flush_lock: flushes run while request
+        # handlers hold pooled connections, so they must never wait on the pool
+        self._conn = None
+
+    def add(self, game_pin, question_id, participant, answer, is_correct):
+        row = (game_pin, question_id, participant, answer, is_correct)
+        if self.flush_interval <= 0:
+            with self._flush_lock:
+                self._write([row])
+            return
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self.max_rows
+            # Started lazily so each gunicorn worker gets its own thread after fork
+            if self._thread is None:
+                self._start()
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._rows)
+
+    def flush(self):
+        """Commit everything buffered so far; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                self._write(rows)
+            except sqlite3.OperationalError as e:
+                # Database busy/locked: keep the rows and retry on the next tick
+                print(f"⚠️ Answer flush failed, retrying: {e}")
+                with self._lock:
+                    self._rows[:0] = rows
+                return 0
+            return len(rows)
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="answer-buffer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # The flusher must outlive any one batch, or answers pile up unsaved
+                print(f"⚠️ Answer flush crashed: {e!r}")
+
+    def _write(self, rows):
+        # Called with _flush_lock held
+        if self._conn is None:
+            self._conn = open_connection()
+        conn = self._conn
+        try:
+            with conn:
+                conn.executemany(INSERT_RESPONSE, rows)
+        except sqlite3.OperationalError:
+            raise  # Busy or locked: flush() keeps the rows for the next tick
+        except sqlite3.Error:
+            # One bad row (constraint, unbindable value) must not sink the whole batch
+            with conn:
+                for row in rows:
+                    try:
+                        conn.execute(INSERT_RESPONSE, row)
+                    except sqlite3.OperationalError:
+                        raise
+                    except sqlite3.Error as e:
+                        print(f"⚠️ Dropping answer {row}: {e}")
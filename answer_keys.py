@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+
+# Games kept in memory at once; the least recently used key is evicted first
+MAX_GAMES = 1000
+
+
+class AnswerKeyCache:
+    """In-process answer keys for running games: game PIN -> question_id -> answer.
+
+    Keys are loaded once per game (at /start_quiz, or lazily after a restart)
+    so scoring an answer is a dictionary lookup. PINs and question ids are
+    stored as strings because clients send both ints and strings.
+    """
+
+    def __init__(self, max_games=MAX_GAMES):
+        self.max_games = max_games
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, conn, game_pin, quiz_id=None):
+        """(Re)load the answer key for a game and return it"""
+        if quiz_id is None:
+            row = conn.execute("SELECT quiz_id FROM game_sessions WHERE pin = ?", (game_pin,)).fetchone()
+            if not row:
+                return None
+            quiz_id = row[0]
+        rows = conn.execute("SELECT id, correct_answer FROM questions WHERE quiz_id = ?", (quiz_id,))
+        key = {str(question_id): answer for question_id, answer in rows}
+        with self._lock:
+            self._keys[str(game_pin)] = key
+            self._keys.move_to_end(str(game_pin))
+            while len(self._keys) > self.max_games:
+                self._keys.popitem(last=False)
+        return key
+
+    def key_for(self, conn, game_pin):
+        """Return the cached key for a game, loading it on first use"""
+        with self._lock:
+            key = self._keys.get(str(game_pin))
+            if key is not None:
+                self._keys.move_to_end(str(game_pin))
+        if key is None:
+            key = self.load(conn, game_pin)
+        return key if key is not None else {}
+
+    def correct_answer(self, conn, game_pin, question_id):
+        """Return the correct answer for a question in a game, or None if unknown"""
+        key = self.key_for(conn, game_pin)
+        answer = key.get(str(question_id))
+        if answer is None:
+            # Not part of the game's quiz (older clients allow this); look it up once
+            row = conn.execute("SELECT correct_answer FROM questions WHERE id = ?", (question_id,)).fetchone()
+            if not row:
+                return None
+            answer = row[0]
+            with self._lock:
+                key[str(question_id)] = answer
+        return answer
+
+    def invalidate_question(self, question_id):
+        """Forget a question everywhere after it has been edited or reassigned"""
+        question_id = str(question_id)
+        with self._lock:
+            for key in self._keys.values():
+                key.pop(question_id, None)
+
+    def drop_game(self, game_pin):
+        """Forget a game's key once it has ended"""
+        with self._lock:
+            self._keys.pop(str(game_pin), None)
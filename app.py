@@ -1,12 +1,49 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import sqlite3
+import io
+import json
+import queue
 import random
+import re
+import statistics
 import google.generativeai as genai
 import PyPDF2, docx
 import os
 from datetime import datetime
+from answer_buffer import AnswerBuffer
+from answer_keys import AnswerKeyCache
+from catalog import QuestionCatalog
+from db import connect_db, init_app as init_db, pooled_connection, release_db
+from dedup import add_signature, index_missing, index_question, init_app as init_dedup, signature
+from game_state import ENDED, GAME_ENDED_EVENT, GameRegistry, Player, QuestionStats
+from irt import init_app as init_irt
+from item_analysis import init_app as init_item_analysis, item_report, load_matrix
+from migrations import migrate
+from question_bank import (
+    CONTENT_TYPES, EXPORT_FILTERS, FORMATS, detect_format, export_query, export_questions as export_question_rows,
+    import_questions as import_question_rows, init_app as init_question_bank
+)
+from rollups import UNKNOWN_DAY, init_app as init_rollups, refresh_district_rollup
 
 app = Flask(__name__)
+init_db(app)
+init_rollups(app)
+init_item_analysis(app)
+init_irt(app)
+init_dedup(app)
+init_question_bank(app)
+
+# Buffers /submit_answer inserts and commits them in batches
+answer_buffer = AnswerBuffer()
+
+# Correct answers of running games, loaded once at /start_quiz
+answer_keys = AnswerKeyCache()
+
+# class -> subject -> book -> chapter tree behind the question pickers
+question_catalog = QuestionCatalog()
+
+# Live game state (phase, question index, roster, scores) held in memory
+games = GameRegistry(before_rebuild=answer_buffer.flush)
 
 # Connect to SQLite Database
 
@@ -82,130 +119,37 @@ def add_ai_questions():
     if not quiz_id or not questions:
         return jsonify({"error": "Quiz ID and questions are required"}), 400
 
+    possible_duplicates = []
     with connect_db() as conn:
         cursor = conn.cursor()
 
         for q in questions:
             print(f"✅ Adding Question: {q['question']}")  # Debugging
+            options = (q['incorrect_options'][0], q['incorrect_options'][1], q['incorrect_options'][2], q['correct_answer'])
             cursor.execute('''
                 INSERT INTO questions (quiz_id, question, option1, option2, option3, option4, correct_answer)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (quiz_id, q['question'], q['incorrect_options'][0], q['incorrect_options'][1], q['incorrect_options'][2], q['correct_answer'], q['correct_answer']))
+            ''', (quiz_id, q['question'], *options, q['correct_answer']))
+            duplicates = index_question(conn, "questions", cursor.lastrowid, q['question'], options)
+            if duplicates:
+                possible_duplicates.append({"id": cursor.lastrowid, "question": q['question'], "duplicates": duplicates})
 
         conn.commit()
 
     print("✅ All AI-generated questions added successfully!")
-    return jsonify({"message": "AI-generated questions added successfully!"})
-
-
-# Connect to SQLite Database
-def connect_db():
-    return sqlite3.connect("database.db")
-
-
-
-
-def init_new_questions_table():
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS new_questions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                class_level TEXT NOT NULL,
-                subject TEXT NOT NULL,
-                book_name TEXT NOT NULL,
-                chapter TEXT NOT NULL,
-                question TEXT NOT NULL,
-                option1 TEXT NOT NULL,
-                option2 TEXT NOT NULL,
-                option3 TEXT NOT NULL,
-                option4 TEXT NOT NULL,
-                correct_answer TEXT NOT NULL
-            )
-        ''')
-        conn.commit()
-
-
-# Create a table for quizzes
-# Create a table for quizzes
-def create_table():
-    with connect_db() as conn:
-        cursor = conn.cursor()
-        
-        # Create quizzes table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS quizzes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                category TEXT NOT NULL
-            )
-        ''')
-
-        # Create questions table
-        # ✅ Modified questions table schema:
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS questions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                quiz_id INTEGER,  -- ✅ Optional, can be NULL
-                class_level TEXT NOT NULL,
-                subject TEXT NOT NULL,
-                book_name TEXT NOT NULL,
-                chapter TEXT NOT NULL,  -- ✅ Newly added field
-                question TEXT NOT NULL,
-                option1 TEXT NOT NULL,
-                option2 TEXT NOT NULL,
-                option3 TEXT NOT NULL,
-                option4 TEXT NOT NULL,
-                correct_answer TEXT NOT NULL,
-                FOREIGN KEY (quiz_id) REFERENCES quizzes(id)
-            )
-        ''')
-
-        # Create game_sessions table with current_question_index
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS game_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                quiz_id INTEGER NOT NULL,
-                pin INTEGER NOT NULL,
-                status TEXT DEFAULT "active",
-                current_question_index INTEGER DEFAULT 0,
-                FOREIGN KEY (quiz_id) REFERENCES quizzes(id)
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS participants (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                player_name TEXT NOT NULL,
-                phone_number TEXT NOT NULL,
-                email_id TEXT NOT NULL,
-                district TEXT NOT NULL,
-                game_pin INTEGER NOT NULL
-            )
-        ''')
-
-        # Create responses table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS responses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                game_pin INTEGER NOT NULL,
-                question_id INTEGER NOT NULL,
-                participant TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                is_correct INTEGER NOT NULL,
-                FOREIGN KEY (question_id) REFERENCES questions(id)
-            )
-        ''')
+    return jsonify({
+        "message": "AI-generated questions added successfully!",
+        "possible_duplicates": possible_duplicates
+    })
 
-        # Add current_question_index to existing tables if it doesn't exist
-        try:
-            cursor.execute("SELECT current_question_index FROM game_sessions LIMIT 1")
-        except sqlite3.OperationalError:
-            cursor.execute("ALTER TABLE game_sessions ADD COLUMN current_question_index INTEGER DEFAULT 0")
-            
-        conn.commit()
 
-create_table()
+# Apply any pending schema migrations once at startup, then bring the
+# district rollup and the near-duplicate index up to date with the answers
+# and questions they have not seen yet
+migrate()
+with pooled_connection() as conn, conn:
+    refresh_district_rollup(conn)
+    index_missing(conn)
 
 
 
@@ -219,20 +163,13 @@ def move_to_next_question():
         return jsonify({"error": "Game PIN and new question index are required"}), 400
     
     try:
-        with connect_db() as conn:
-            cursor = conn.cursor()
-            
-            # Update the current question index for this game
-            cursor.execute(
-                "UPDATE game_sessions SET current_question_index = ? WHERE pin = ?", 
-                (new_question_index, game_pin)
-            )
-            
-            # Check if update was successful
-            if cursor.rowcount == 0:
-                return jsonify({"error": "Invalid game PIN"}), 404
-                
-            conn.commit()
+        conn = connect_db()
+        game = games.get(conn, game_pin)
+        if not game:
+            return jsonify({"error": "Invalid game PIN"}), 404
+
+        # Update the current question index for this game
+        games.move_to_question(conn, game, new_question_index)
             
         return jsonify({"success": True})
     except sqlite3.Error as e:
@@ -241,6 +178,44 @@ def move_to_next_question():
 
 
 
+# Long-poll limits for since_version requests, in seconds
+LONG_POLL_TIMEOUT = 25
+LONG_POLL_MAX_TIMEOUT = 60
+
+
+def wait_for_game_change(game):
+    """Long-poll support for the polling routes.
+
+    When the client passes ?since_version=N, hold the request until the
+    game's version moves past N (woken by move_to_next_question,
+    start_quiz_for_all or end_quiz) or the timeout expires. Without it the
+    current state is returned straight away.
+    """
+    since_version = request.args.get('since_version', type=int)
+    if since_version is None:
+        return
+    timeout = request.args.get('timeout', LONG_POLL_TIMEOUT, type=float)
+    # Give the connection back to the pool for the wait; under the gevent
+    # worker the wait itself only parks a greenlet
+    release_db()
+    games.wait_for_change(game, since_version, min(max(timeout, 0), LONG_POLL_MAX_TIMEOUT))
+
+
+def not_modified(etag):
+    """Return a 304 if the client already holds this ETag, else None"""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+    return None
+
+
+def with_etag(response, etag):
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "no-cache"  # Always revalidate
+    return response
+
+
 @app.route('/check_current_question', methods=['GET'])
 def check_current_question():
     game_pin = request.args.get('game_pin')
@@ -249,21 +224,16 @@ def check_current_question():
         return jsonify({"error": "Game PIN is required"}), 400
     
     try:
-        with connect_db() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "SELECT current_question_index FROM game_sessions WHERE pin = ?", 
-                (game_pin,)
-            )
-            
-            result = cursor.fetchone()
-            if not result:
-                return jsonify({"error": "Invalid game PIN"}), 404
-                
-            current_question_index = result[0] or 0
-            
-        return jsonify({"current_question_index": current_question_index})
+        game = games.get(connect_db(), game_pin)
+        if not game:
+            return jsonify({"error": "Invalid game PIN"}), 404
+
+        wait_for_game_change(game)
+        version = game.version
+        etag = game.etag(version)
+        return not_modified(etag) or with_etag(
+            jsonify({"current_question_index": game.current_question_index, "version": version}), etag
+        )
     except sqlite3.Error as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
@@ -290,9 +260,6 @@ def add_quiz():
 
 
 
-# Add this dictionary at the top of your file to store waiting participants
-waiting_participants = {}  # Dict of game_pin -> list of participants
-
 @app.route("/join_quiz", methods=["POST"])
 def join_quiz():
     data = request.get_json()
@@ -302,62 +269,24 @@ def join_quiz():
     district = data.get("district")
     game_pin = data.get("gamePin")
     
-    # Convert game_pin to string to ensure consistent key type
-    game_pin_str = str(game_pin)
-    
-    print(f"DEBUG: Received join request from {player_name} for PIN {game_pin_str}")
+    print(f"DEBUG: Received join request from {player_name} for PIN {game_pin}")
 
     if not all([player_name, phone_number, email_id, district, game_pin]):
         return jsonify({"error": "All fields are required!"}), 400
 
     try:
         conn = connect_db()
-        cursor = conn.cursor()
-
-        # Check if the game PIN exists in the active game_sessions
-        cursor.execute("SELECT * FROM game_sessions WHERE pin = ? AND status = 'active'", (game_pin,))
-        game = cursor.fetchone()
 
-        if not game:
+        # Check if the game PIN belongs to an active game
+        game = games.get(conn, game_pin)
+        if not game or not game.is_active:
             return jsonify({"error": "Invalid or inactive game PIN!"}), 400
 
-        # Check if the started_for_all column exists in game_sessions table
-        try:
-            cursor.execute("SELECT started_for_all FROM game_sessions WHERE pin = ?", (game_pin,))
-        except sqlite3.OperationalError:
-            # Column doesn't exist, add it
-            cursor.execute("ALTER TABLE game_sessions ADD COLUMN started_for_all INTEGER DEFAULT 0")
-            conn.commit()
-
-        # Check if the quiz has already started for all
-        cursor.execute("SELECT started_for_all FROM game_sessions WHERE pin = ?", (game_pin,))
-        started = cursor.fetchone()[0]
+        # Admitted directly if the quiz already started, otherwise put on the waiting list
+        admitted = games.join(conn, game, Player(player_name, phone_number, email_id, district))
+        if not admitted:
+            print(f"DEBUG: Added {player_name} to waiting list for PIN {game.pin}")
 
-        if started == 1:
-            # If quiz already started, add participant directly
-            cursor.execute(
-                "INSERT INTO participants (player_name, phone_number, email_id, district, game_pin) VALUES (?, ?, ?, ?, ?)",
-                (player_name, phone_number, email_id, district, game_pin)
-            )
-            conn.commit()
-        else:
-            # Otherwise, add to waiting list - use string key
-            if game_pin_str not in waiting_participants:
-                waiting_participants[game_pin_str] = []
-            
-            from datetime import datetime
-            waiting_participants[game_pin_str].append({
-                'player_name': player_name,
-                'phone_number': phone_number,
-                'email_id': email_id,
-                'district': district,
-                'join_time': datetime.now().strftime("%H:%M:%S")
-            })
-            
-            print(f"DEBUG: Added {player_name} to waiting list for PIN {game_pin_str}")
-            print(f"DEBUG: Current waiting list for PIN {game_pin_str}: {waiting_participants.get(game_pin_str, [])}")
-
-        conn.close()
         return jsonify({"success": True}), 200
 
     except sqlite3.Error as e:
@@ -374,37 +303,72 @@ def check_quiz_status():
     
     # Check if this game has been started for all
     try:
-        with connect_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT started_for_all FROM game_sessions WHERE pin = ?", (game_pin,))
-            result = cursor.fetchone()
-            
-            if not result:
-                return jsonify({"error": "Invalid game PIN"}), 404
-            
-            # Check if started for all
-            if result[0] == 1:
-                print(f"DEBUG: Quiz with PIN {game_pin} has started for all participants")
-                return jsonify({"status": "started"})
-            else:
-                return jsonify({"status": "waiting"})
+        game = games.get(connect_db(), game_pin)
+        if not game:
+            return jsonify({"error": "Invalid game PIN"}), 404
+
+        wait_for_game_change(game)
+        version = game.version
+        etag = game.etag(version)
+        return not_modified(etag) or with_etag(jsonify({"status": game.phase, "version": version}), etag)
     except sqlite3.Error as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
 
+# Seconds between keep-alive comments on idle event streams
+SSE_KEEPALIVE = 15
+
+
+@app.route('/game_events/<game_pin>', methods=['GET'])
+def game_events(game_pin):
+    """Server-Sent Events stream of phase changes for one game.
+
+    Pushes `started`, `question_changed` and `game_ended` as they happen, so
+    participants don't have to poll /check_quiz_status and
+    /check_current_question. The first event is a `state` snapshot.
+    """
+    game = games.get(connect_db(), game_pin)
+    if not game:
+        return jsonify({"error": "Invalid game PIN"}), 404
+
+    listener = games.subscribe(game)
+
+    def stream():
+        try:
+            yield f"id: {game.version}\nevent: state\ndata: {json.dumps(game.snapshot())}\n\n"
+            event = GAME_ENDED_EVENT if game.phase == ENDED else None
+            while event != GAME_ENDED_EVENT:
+                try:
+                    version, event, data = listener.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {version}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            # Runs when the client disconnects and the response is closed
+            games.unsubscribe(game, listener)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # Don't let a proxy buffer the stream
+    })
+
+
 @app.route('/get_waiting_participants', methods=['GET'])
 def get_waiting_participants():
     game_pin = request.args.get('game_pin')
     if not game_pin:
         return jsonify({"error": "Game PIN is required"}), 400
     
-    # Convert to string to ensure consistent key type
-    game_pin_str = str(game_pin)
-    
-    # Return participants waiting for this game - use string key
-    participants = waiting_participants.get(game_pin_str, [])
-    print(f"DEBUG: Returning {len(participants)} waiting participants for PIN {game_pin_str}")
-    return jsonify({"participants": participants})
+    # Return participants waiting for this game
+    game = games.get(connect_db(), game_pin)
+    if not game:
+        return jsonify({"participants": []})
+
+    etag = game.etag(game.revision)
+    return not_modified(etag) or with_etag(
+        jsonify({"participants": [player.to_dict() for player in game.waiting]}), etag
+    )
 
 
 @app.route('/start_quiz_for_all', methods=['POST'])
@@ -415,52 +379,48 @@ def start_quiz_for_all():
     if not game_pin:
         return jsonify({"error": "Game PIN is required"}), 400
     
-    # Convert to string to ensure consistent key type
-    game_pin_str = str(game_pin)
+    print(f"DEBUG: Attempting to start quiz for all with PIN: {game_pin}")
     
-    print(f"DEBUG: Attempting to start quiz for all with PIN: {game_pin_str}")
-    print(f"DEBUG: Current waiting participants: {waiting_participants}")
-    print(f"DEBUG: Waiting for game PIN {game_pin_str}: {waiting_participants.get(game_pin_str, [])}")
-    
-    # Add all waiting participants to the database
-    if game_pin_str in waiting_participants and waiting_participants[game_pin_str]:
-        try:
-            with connect_db() as conn:
-                cursor = conn.cursor()
-                
-                # Mark this game as started for all
-                cursor.execute("UPDATE game_sessions SET started_for_all = 1 WHERE pin = ?", (game_pin,))
-                
-                # Check if update worked
-                cursor.execute("SELECT started_for_all FROM game_sessions WHERE pin = ?", (game_pin,))
-                status = cursor.fetchone()
-                print(f"DEBUG: After update, started_for_all = {status[0] if status else 'not found'}")
-                
-                # Make a copy of participants before we clear the list
-                participants_copy = waiting_participants[game_pin_str].copy()
-                
-                # Insert all waiting participants
-                for participant in participants_copy:
-                    cursor.execute(
-                        "INSERT INTO participants (player_name, phone_number, email_id, district, game_pin) VALUES (?, ?, ?, ?, ?)",
-                        (participant['player_name'], participant['phone_number'], participant['email_id'], participant['district'], game_pin)
-                    )
-                
-                conn.commit()
-                
-                participant_count = len(participants_copy)
-                
-                # Clear waiting list AFTER successful database insertion
-                waiting_participants[game_pin_str] = []
-                
-                print(f"DEBUG: Successfully started quiz for {participant_count} participants")
-                return jsonify({"success": True, "participants_count": participant_count})
-        except sqlite3.Error as e:
-            print(f"DEBUG: Database error when starting quiz: {str(e)}")
-            return jsonify({"error": f"Database error: {str(e)}"}), 500
-    
-    print("DEBUG: No waiting participants found, or PIN not in dictionary")
-    return jsonify({"success": True, "participants_count": 0})
+    try:
+        conn = connect_db()
+        game = games.get(conn, game_pin)
+        if not game:
+            return jsonify({"error": "Invalid game PIN"}), 404
+
+        # Mark this game as started and admit everyone who was waiting
+        participant_count = games.start_for_all(conn, game)
+
+        print(f"DEBUG: Successfully started quiz for {participant_count} participants")
+        return jsonify({"success": True, "participants_count": participant_count})
+    except sqlite3.Error as e:
+        print(f"DEBUG: Database error when starting quiz: {str(e)}")
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+
+@app.route('/end_quiz', methods=['POST'])
+def end_quiz():
+    data = request.get_json()
+    game_pin = data.get('game_pin')
+
+    if not game_pin:
+        return jsonify({"error": "Game PIN is required"}), 400
+
+    try:
+        conn = connect_db()
+        game = games.get(conn, game_pin)
+        if not game:
+            return jsonify({"error": "Invalid game PIN"}), 404
+
+        games.end(conn, game)
+        answer_keys.drop_game(game.pin)
+
+        # Fold the finished game into the district rollup straight away
+        answer_buffer.flush()
+        refresh_district_rollup(conn, [game.pin])
+        conn.commit()
+        return jsonify({"success": True})
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
 
 
 
@@ -503,9 +463,15 @@ def add_question():
                 quiz_id, class_level, subject, book_name, chapter, question,
                 option1, option2, option3, option4, correct_answer
             ))
+            question_id = cursor.lastrowid
+            duplicates = index_question(conn, "questions", question_id, question, (option1, option2, option3, option4))
             conn.commit()
 
-        return jsonify({"success": "Question added successfully!"}), 200
+        return jsonify({
+            "success": "Question added successfully!",
+            "id": question_id,
+            "possible_duplicates": duplicates
+        }), 200
 
     except sqlite3.IntegrityError as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
@@ -572,17 +538,17 @@ def get_question_responses():
             cursor = conn.cursor()
             
             # Get the correct answer for this question
-            cursor.execute(
-                "SELECT correct_answer FROM questions WHERE id = ?", 
-                (question_id,)
-            )
-            
-            question_result = cursor.fetchone()
-            if not question_result:
+            correct_answer = answer_keys.correct_answer(conn, game_pin, question_id)
+            if correct_answer is None:
                 return jsonify({"error": "Question not found"}), 404
-                
-            correct_answer = question_result[0]
-            
+
+            # Default: per-option counts kept in memory as answers arrive.
+            # Pass "rows": true for every individual response instead.
+            if not data.get('rows'):
+                return jsonify(question_histogram(conn, game_pin, question_id, correct_answer))
+
+            answer_buffer.flush()
+
             # Get all responses for this question
             cursor.execute(
                 """
@@ -614,32 +580,86 @@ def get_question_responses():
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
 
+def question_histogram(conn, game_pin, question_id, correct_answer):
+    """Answer distribution of one question in a game, with the response rate"""
+    options = conn.execute(
+        "SELECT option1, option2, option3, option4 FROM questions WHERE id = ?", (question_id,)
+    ).fetchone() or ()
+
+    game = games.get(conn, game_pin)
+    if game:
+        with game.lock:
+            stats = game.questions.get(str(question_id)) or QuestionStats()
+            counts, other = stats.histogram(options)
+            correct, total = stats.correct, stats.answered
+            roster_size = len(game.roster)
+    else:
+        counts, other = [(option, 0) for option in options], 0
+        correct = total = roster_size = 0
+
+    return {
+        "success": True,
+        "correct_answer": correct_answer,
+        "options": [
+            {"option": option, "count": count, "is_correct": option == correct_answer}
+            for option, count in counts
+        ],
+        "other": other,
+        "correct": correct,
+        "total_responses": total,
+        "roster_size": roster_size,
+        "response_rate": round(total / roster_size * 100, 2) if roster_size else None
+    }
+
+
+
+# Stay well under SQLite's bound-parameter limit (999 on older builds)
+SQL_IN_CHUNK = 900
+MAX_ANSWER_IDS = 10000
+
+
+def fetch_correct_answers(conn, question_ids):
+    """Map str(question_id) -> correct_answer using one IN (...) query per chunk"""
+    answers = {}
+    ids = list(dict.fromkeys(question_ids))
+    for start in range(0, len(ids), SQL_IN_CHUNK):
+        chunk = ids[start:start + SQL_IN_CHUNK]
+        placeholders = ", ".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT id, correct_answer FROM questions WHERE id IN ({placeholders})", chunk
+        )
+        answers.update((str(question_id), answer) for question_id, answer in rows)
+    return answers
+
 
 @app.route('/get_correct_answers', methods=['POST'])
 def get_correct_answers():
     data = request.json
     question_ids = data.get('question_ids')
+    game_pin = data.get('game_pin')  # Optional, answers come from the game's cached key
+    as_map = data.get('as_map', False)  # Return {question_id: answer} instead of a list
     
-    if not question_ids:
+    if not question_ids or not isinstance(question_ids, list):
         return jsonify({"error": "Question IDs are required"}), 400
+    if len(question_ids) > MAX_ANSWER_IDS:
+        return jsonify({"error": f"At most {MAX_ANSWER_IDS} question IDs per request"}), 400
     
     try:
-        with connect_db() as conn:
-            cursor = conn.cursor()
-            
-            correct_answers = []
-            for question_id in question_ids:
-                cursor.execute(
-                    "SELECT correct_answer FROM questions WHERE id = ?", 
-                    (question_id,)
-                )
-                
-                result = cursor.fetchone()
-                if result:
-                    correct_answers.append(result[0])
-                else:
-                    correct_answers.append(None)
-            
+        conn = connect_db()
+        answers = {}
+        if game_pin:
+            key = answer_keys.key_for(conn, game_pin)
+            answers = {str(q): key[str(q)] for q in question_ids if str(q) in key}
+
+        missing = [q for q in question_ids if str(q) not in answers]
+        if missing:
+            answers.update(fetch_correct_answers(conn, missing))
+
+        if as_map:
+            correct_answers = {str(q): answers.get(str(q)) for q in question_ids}
+        else:
+            correct_answers = [answers.get(str(q)) for q in question_ids]
+
         return jsonify({
             "success": True,
             "correct_answers": correct_answers
@@ -656,26 +676,23 @@ def get_books_and_chapters():
     if not class_level or not subject:
         return jsonify({"books": [], "chapters": []})
 
-    # Assuming you store questions with class, subject, book_name, chapter fields
-    conn = sqlite3.connect("your_database.db")
-    cursor = conn.cursor()
+    conn = connect_db()
+    return jsonify({
+        "books": question_catalog.books(conn, class_level, subject),
+        "chapters": question_catalog.chapters(conn, class_level, subject)
+    })
 
-    # Get distinct books
-    cursor.execute(
-        "SELECT DISTINCT book_name FROM questions WHERE class = ? AND subject = ?",
-        (class_level, subject)
-    )
-    books = [row[0] for row in cursor.fetchall()]
 
-    # Get distinct chapters
-    cursor.execute(
-        "SELECT DISTINCT chapter FROM questions WHERE class = ? AND subject = ?",
-        (class_level, subject)
-    )
-    chapters = [row[0] for row in cursor.fetchall()]
+@app.route("/catalog", methods=["GET"])
+def catalog():
+    """Every class -> subject -> book -> chapter with its number of questions"""
+    try:
+        version, tree = question_catalog.tree(connect_db())
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
 
-    conn.close()
-    return jsonify({"books": books, "chapters": chapters})
+    etag = f"catalog-{version}"
+    return not_modified(etag) or with_etag(jsonify({"classes": tree, "version": version}), etag)
 
 
 @app.route("/fetch_filtered_questions", methods=["POST"])
@@ -711,6 +728,90 @@ def fetch_filtered_questions():
 
 
 
+# Question banks /search_questions can look in (each has a <table>_fts index)
+SEARCH_SOURCES = ("questions", "new_questions")
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word must match, the last as a prefix"""
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+@app.route("/search_questions", methods=["POST"])
+def search_questions():
+    """Ranked full-text search over question text and options.
+
+    Body: q (required), optional class_level / subject / book_name / chapter
+    filters, source ("questions", "new_questions" or "all", the default),
+    page (from 1) and page_size. Matches in the question text weigh more
+    than matches in the options.
+    """
+    data = request.get_json()
+    match = fts_query(data.get("q") or "")
+    if not match:
+        return jsonify({"error": "Search text is required!"}), 400
+
+    source = data.get("source", "all")
+    if source != "all" and source not in SEARCH_SOURCES:
+        return jsonify({"error": f"Unknown source: {source}"}), 400
+    try:
+        page = max(int(data.get("page", 1)), 1)
+        page_size = min(max(int(data.get("page_size", SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return jsonify({"error": "page and page_size must be integers"}), 400
+
+    filters = [(column, data[column]) for column in ("class_level", "subject", "book_name", "chapter")
+               if data.get(column)]
+    selects, params = [], []
+    for table in (SEARCH_SOURCES if source == "all" else (source,)):
+        conditions = [f"{table}_fts MATCH ?"] + [f"t.{column} = ?" for column, _ in filters]
+        selects.append(f"""
+            SELECT '{table}' AS source, t.id, t.class_level, t.subject, t.book_name, t.chapter,
+                   t.question, t.option1, t.option2, t.option3, t.option4, t.correct_answer,
+                   bm25({table}_fts, 10.0, 1.0, 1.0, 1.0, 1.0) AS score
+            FROM {table}_fts JOIN {table} t ON t.id = {table}_fts.rowid
+            WHERE {" AND ".join(conditions)}
+        """)
+        params += [match] + [value for _, value in filters]
+
+    try:
+        rows = connect_db().execute(
+            " UNION ALL ".join(selects) + " ORDER BY score LIMIT ? OFFSET ?",
+            params + [page_size + 1, (page - 1) * page_size]
+        ).fetchall()
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+    results = [{
+        "source": row[0],
+        "id": row[1],
+        "class_level": row[2],
+        "subject": row[3],
+        "book_name": row[4],
+        "chapter": row[5],
+        "question": row[6],
+        "option1": row[7],
+        "option2": row[8],
+        "option3": row[9],
+        "option4": row[10],
+        "correct_answer": row[11],
+        "score": round(-row[12], 4)  # bm25() is lower-is-better
+    } for row in rows[:page_size]]
+
+    return jsonify({
+        "success": True,
+        "results": results,
+        "page": page,
+        "page_size": page_size,
+        "has_more": len(rows) > page_size
+    })
+
+
 @app.route("/generate_pre_post_quiz", methods=["POST"])
 def generate_pre_post_quiz():
     try:
@@ -724,24 +825,19 @@ def generate_pre_post_quiz():
             return jsonify({"error": "Missing parameters!"}), 400
 
         with connect_db() as conn:
-            cursor = conn.cursor()
-
-            # Fetch available questions from DB
-            cursor.execute("""
-                SELECT id, question, option1, option2, option3, option4, correct_answer 
-                FROM questions
-                WHERE class_level = ? AND subject = ? AND book_name = ? AND chapter = ?
-            """, (class_level, subject, book_name, chapter))
-
-            questions = cursor.fetchall()
+            questions = balanced_form_candidates(conn, class_level, subject, book_name, chapter)
 
-        if len(questions) < 20:
+        if len(questions) < 2 * FORM_SIZE:
             return jsonify({"error": "Not enough questions to create two separate quizzes!"}), 400
 
-        # Shuffle and split questions
-        random.shuffle(questions)
-        pre_quiz_questions = questions[:10]
-        post_quiz_questions = questions[10:20]
+        # Candidates come in difficulty-matched pairs; each form gets one of
+        # every pair, so both have the same difficulty distribution
+        pre_quiz_questions, post_quiz_questions = [], []
+        for first, second in zip(questions[::2], questions[1::2]):
+            if random.random() < 0.5:
+                first, second = second, first
+            pre_quiz_questions.append(first)
+            post_quiz_questions.append(second)
 
         with connect_db() as conn:
             cursor = conn.cursor()
@@ -755,7 +851,9 @@ def generate_pre_post_quiz():
                 cursor.execute("""
                     INSERT INTO questions (quiz_id, class_level, subject, book_name, chapter, question, option1, option2, option3, option4, correct_answer)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (pre_quiz_id, class_level, subject, book_name, chapter, *q[1:]))
+                """, (pre_quiz_id, class_level, subject, book_name, chapter, *q[1:7]))
+                # Copies of bank questions by design: indexed, not reported
+                add_signature(conn, "questions", cursor.lastrowid, signature(q[1], q[2:6]))
 
             # Insert Post-Assessment Quiz
             cursor.execute("INSERT INTO quizzes (title, category) VALUES (?, ?)", 
@@ -766,20 +864,67 @@ def generate_pre_post_quiz():
                 cursor.execute("""
                     INSERT INTO questions (quiz_id, class_level, subject, book_name, chapter, question, option1, option2, option3, option4, correct_answer)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (post_quiz_id, class_level, subject, book_name, chapter, *q[1:]))
+                """, (post_quiz_id, class_level, subject, book_name, chapter, *q[1:7]))
+                add_signature(conn, "questions", cursor.lastrowid, signature(q[1], q[2:6]))
 
             conn.commit()
 
         return jsonify({
             "success": True,
             "pre_quiz_id": pre_quiz_id,
-            "post_quiz_id": post_quiz_id
+            "post_quiz_id": post_quiz_id,
+            "mean_difficulty": {
+                "pre": mean_difficulty(pre_quiz_questions),
+                "post": mean_difficulty(post_quiz_questions)
+            }
         })
 
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
 
+# Questions per pre/post form
+FORM_SIZE = 10
+# Calibration whose difficulties balance the forms (see irt.py)
+FORM_IRT_MODEL = "2pl"
+
+
+def balanced_form_candidates(conn, class_level, subject, book_name, chapter):
+    """2 * FORM_SIZE distinct questions of a chapter in difficulty-matched pairs.
+
+    Each distinct question text gets the mean calibrated difficulty of all
+    its copies (earlier generated quizzes copy questions, and the copies are
+    the ones with answers). The chapter is cut into FORM_SIZE difficulty
+    strata and two random questions are drawn from each, all in SQL.
+    Questions never calibrated count as average difficulty (0).
+    Rows: (id, question, option1..4, correct_answer, difficulty or None).
+    """
+    return conn.execute("""
+        WITH bank AS (
+            SELECT MIN(q.id) AS id, q.question, q.option1, q.option2, q.option3, q.option4,
+                   q.correct_answer, AVG(irt.difficulty) AS difficulty
+            FROM questions q
+            LEFT JOIN question_irt irt ON irt.question_id = q.id AND irt.model = ?
+            WHERE q.class_level = ? AND q.subject = ? AND q.book_name = ? AND q.chapter = ?
+            GROUP BY q.question
+        ),
+        strata AS (
+            SELECT *, NTILE(?) OVER (ORDER BY IFNULL(difficulty, 0), random()) AS stratum FROM bank
+        ),
+        drawn AS (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY stratum ORDER BY random()) AS draw FROM strata
+        )
+        SELECT id, question, option1, option2, option3, option4, correct_answer, difficulty
+        FROM drawn WHERE draw <= 2
+        ORDER BY stratum, draw
+    """, (FORM_IRT_MODEL, class_level, subject, book_name, chapter, FORM_SIZE)).fetchall()
+
+
+def mean_difficulty(questions):
+    known = [q[7] for q in questions if q[7] is not None]
+    return round(sum(known) / len(known), 3) if known else None
+
+
 
 
 
@@ -809,11 +954,7 @@ def get_books():
     if not class_level or not subject:
         return jsonify({"error": "Class Level and Subject are required!"}), 400
 
-    with connect_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT book_name FROM questions WHERE class_level = ? AND subject = ? AND book_name IS NOT NULL", 
-                       (class_level, subject))
-        books = [row[0] for row in cursor.fetchall()]
+    books = question_catalog.books(connect_db(), class_level, subject)
 
     return jsonify({"books": books})
 
@@ -830,11 +971,7 @@ def get_chapters():
     if not class_level or not subject or not book_name:
         return jsonify({"error": "Class, Subject, and Book are required!"}), 400
 
-    with connect_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT chapter FROM questions WHERE class_level = ? AND subject = ? AND book_name = ?", 
-                       (class_level, subject, book_name))
-        chapters = [row[0] for row in cursor.fetchall()]
+    chapters = question_catalog.chapters(connect_db(), class_level, subject, book_name)
 
     return jsonify({"chapters": chapters})
 
@@ -853,7 +990,7 @@ def create_quiz_from_questions():
         return jsonify({"error": "All fields are required!"}), 400
 
     try:
-        conn = sqlite3.connect("database.db")
+        conn = connect_db()
         cursor = conn.cursor()
 
         # Insert new quiz
@@ -865,7 +1002,9 @@ def create_quiz_from_questions():
             cursor.execute("UPDATE questions SET quiz_id = ? WHERE id = ?", (quiz_id, question_id))
 
         conn.commit()
-        conn.close()
+
+        for question_id in selected_questions:
+            answer_keys.invalidate_question(question_id)
 
         return jsonify({"success": "Quiz created successfully!"}), 200
 
@@ -889,58 +1028,142 @@ def submit_answer():
 
     if not all([game_pin, question_id, participant, answer]):
         return jsonify({"error": "All fields are required"}), 400
+    # Buffered rows are written later in the background, so reject anything
+    # SQLite can't bind now rather than fail the whole batch there
+    if not all(isinstance(value, (str, int, float)) for value in (game_pin, question_id, participant, answer)):
+        return jsonify({"error": "game_pin, question_id, participant and answer must be strings or numbers"}), 400
 
-    with connect_db() as conn:
-        cursor = conn.cursor()
-        # Fetch correct answer for validation
-        cursor.execute("SELECT correct_answer FROM questions WHERE id = ?", (question_id,))
-        correct_answer = cursor.fetchone()
+    # Fetch correct answer for validation (cached per game)
+    correct_answer = answer_keys.correct_answer(connect_db(), game_pin, question_id)
 
-        if not correct_answer:
-            return jsonify({"error": "Invalid question"}), 404
+    if correct_answer is None:
+        return jsonify({"error": "Invalid question"}), 404
 
-        is_correct = 1 if answer == correct_answer[0] else 0
+    is_correct = 1 if answer == correct_answer else 0
 
-        # Store response
-        cursor.execute("INSERT INTO responses (game_pin, question_id, participant, answer, is_correct) VALUES (?, ?, ?, ?, ?)",
-                       (game_pin, question_id, participant, answer, is_correct))
-        conn.commit()
+    # Load the game first: rebuilding it flushes the buffer, so the new answer
+    # must not be queued yet or it would be counted twice
+    game = games.get(connect_db(), game_pin)
+
+    # Store response (group-committed by the answer buffer within a few ms)
+    answer_buffer.add(game_pin, question_id, participant, answer, is_correct)
+    if game:
+        games.record_answer(game, participant, question_id, answer, is_correct)
 
     return jsonify({"message": "Answer submitted!", "is_correct": is_correct})
 
 
 
 
+# Rows returned per /get_responses call in since_id mode
+RESPONSES_PAGE_SIZE = 1000
+RESPONSES_MAX_PAGE_SIZE = 5000
+
+
+def response_entry(row):
+    response_id, question_id, participant, answer, is_correct = row
+    return {
+        "id": response_id,
+        "question_id": question_id,
+        "participant": participant,
+        "answer": answer,
+        "is_correct": bool(is_correct)
+    }
+
+
 @app.route('/get_responses', methods=['POST'])
 def get_responses():
+    """Responses of a game.
+
+    Without since_id every response is returned (with an ETag). With
+    since_id only rows whose id is greater are returned, oldest first and at
+    most `limit` of them; pass the returned next_id as the next since_id.
+    format=ndjson streams every row as one JSON object per line instead.
+    """
     data = request.json
     game_pin = data.get('game_pin')
 
     if not game_pin:
         return jsonify({"error": "Game PIN is required"}), 400
 
+    since_id = data.get('since_id')
+    try:
+        since_id = int(since_id) if since_id is not None else None
+        limit = min(max(int(data.get('limit', RESPONSES_PAGE_SIZE)), 1), RESPONSES_MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return jsonify({"error": "since_id and limit must be integers"}), 400
+
+    if data.get('format') == 'ndjson':
+        answer_buffer.flush()
+        return stream_responses(game_pin, since_id or 0)
+
+    if since_id is not None:
+        answer_buffer.flush()
+        rows = connect_db().execute("""
+            SELECT id, question_id, participant, answer, is_correct
+            FROM responses WHERE game_pin = ? AND id > ?
+            ORDER BY id LIMIT ?
+        """, (game_pin, since_id, limit + 1)).fetchall()
+
+        return jsonify({
+            "responses": [response_entry(r) for r in rows[:limit]],
+            "next_id": rows[:limit][-1][0] if rows else since_id,
+            "has_more": len(rows) > limit
+        })
+
+    game = games.get(connect_db(), game_pin)
+    etag = game.etag(game.revision) if game else None
+    if etag:
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        # Answers counted in this revision may still sit in the write buffer
+        answer_buffer.flush()
+
     with connect_db() as conn:
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT question_id, participant, answer, is_correct 
-            FROM responses WHERE game_pin = ?
+            SELECT id, question_id, participant, answer, is_correct
+            FROM responses WHERE game_pin = ? ORDER BY id
         """, (game_pin,))
         responses = cursor.fetchall()
 
-    response_list = []
-    for r in responses:
-        response_list.append({
-            "question_id": r[0],
-            "participant": r[1],
-            "answer": r[2],
-            "is_correct": bool(r[3])
-        })
+    response_list = [response_entry(r) for r in responses]
+
+    response = jsonify({
+        "responses": response_list,
+        "next_id": responses[-1][0] if responses else 0
+    })
+    return with_etag(response, etag) if etag else response
+
+
+def stream_responses(game_pin, since_id):
+    """NDJSON export of a game's responses, read in batches as they are sent"""
+    def stream():
+        # The request's connection is released before the body is sent
+        with pooled_connection() as conn:
+            cursor = conn.execute("""
+                SELECT id, question_id, participant, answer, is_correct
+                FROM responses WHERE game_pin = ? AND id > ?
+                ORDER BY id
+            """, (game_pin, since_id))
+            while True:
+                rows = cursor.fetchmany(RESPONSES_PAGE_SIZE)
+                if not rows:
+                    break
+                yield "".join(json.dumps(response_entry(r)) + "\n" for r in rows)
+
+    return Response(stream(), mimetype="application/x-ndjson", headers={
+        "Content-Disposition": f"attachment; filename=responses_{game_pin}.ndjson"
+    })
+
 
-    return jsonify({"responses": response_list})
 
 
 
 
+def leaderboard_entries(entries):
+    return [{"participant": p, "score": score, "rank": rank} for p, score, rank in entries]
 
 
 @app.route('/get_scores', methods=['POST'])
@@ -951,23 +1174,11 @@ def get_scores():
     if not game_pin:
         return jsonify({"error": "Game PIN is required"}), 400
 
-    with connect_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT participant, SUM(is_correct) as score 
-            FROM responses WHERE game_pin = ? 
-            GROUP BY participant ORDER BY score DESC
-        """, (game_pin,))
-        scores = cursor.fetchall()
+    # Scores are kept up to date in memory as answers arrive
+    game = games.get(connect_db(), game_pin)
+    scores = game.board.ordered() if game else []
 
-    leaderboard = []
-    for s in scores:
-        leaderboard.append({
-            "participant": s[0],
-            "score": s[1]
-        })
-
-    return jsonify({"leaderboard": leaderboard})
+    return jsonify({"leaderboard": leaderboard_entries(scores)})
 
 
 
@@ -1047,40 +1258,27 @@ def start_quiz():
     if not quiz_id:
         return jsonify({"error": "Quiz ID is required"}), 400
 
-    # Generate a random 6-digit PIN
-    game_pin = random.randint(100000, 999999)
-
     with connect_db() as conn:
         cursor = conn.cursor()
         
-        # Ensure tables exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS game_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                quiz_id INTEGER NOT NULL,
-                pin INTEGER NOT NULL,
-                status TEXT DEFAULT "active",
-                FOREIGN KEY (quiz_id) REFERENCES quizzes(id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS responses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                game_pin INTEGER NOT NULL,
-                question_id INTEGER NOT NULL,
-                participant TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                is_correct INTEGER NOT NULL
-            )
-        ''')
-        conn.commit()
-
         # 🛑 **Fix: Insert the new game session into `game_sessions`**
-        cursor.execute('''
-            INSERT INTO game_sessions (quiz_id, pin, status) VALUES (?, ?, 'active')
-        ''', (quiz_id, game_pin))
+        # Generate a random 6-digit PIN, retrying if it collides with an existing game
+        while True:
+            game_pin = random.randint(100000, 999999)
+            try:
+                cursor.execute('''
+                    INSERT INTO game_sessions (quiz_id, pin, status, created_at) VALUES (?, ?, 'active', ?)
+                ''', (quiz_id, game_pin, datetime.now().isoformat(timespec="seconds")))
+                break
+            except sqlite3.IntegrityError as e:
+                if "UNIQUE" not in str(e):
+                    return jsonify({"error": f"Database error: {str(e)}"}), 400
         conn.commit()  # ✅ Save changes to DB
 
+        # Load the answer key now so scoring never has to query questions
+        answer_keys.load(conn, game_pin, quiz_id)
+        games.create(conn, game_pin, quiz_id)
+
     return jsonify({"message": "Quiz started!", "game_pin": game_pin})
 
 
@@ -1100,23 +1298,37 @@ def leaderboard():
     if not game_pin:
         return jsonify({"error": "Game PIN is required"}), 400
 
-    with connect_db() as conn:
-        cursor = conn.cursor()
-
-        # Fetch participant scores from the responses table
-        cursor.execute('''
-            SELECT participant, SUM(is_correct) as score
-            FROM responses
-            WHERE game_pin = ?
-            GROUP BY participant
-            ORDER BY score DESC
-        ''', (game_pin,))
-        leaderboard_data = cursor.fetchall()
-
-    # Convert to JSON format
-    leaderboard_list = [{"participant": row[0], "score": row[1]} for row in leaderboard_data]
-
-    return jsonify({"leaderboard": leaderboard_list})
+    top = data.get('top')  # Optional, only the best N participants
+    participant = data.get('participant')  # Optional, also return this player's rank
+    neighbours = data.get('neighbours', 2)  # Places shown above/below `participant`
+    try:
+        top = max(int(top), 0) if top is not None else None
+        neighbours = max(int(neighbours), 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "top and neighbours must be integers"}), 400
+
+    # Participant scores are ranked in memory as answers arrive
+    game = games.get(connect_db(), game_pin)
+    if not game:
+        return jsonify({"leaderboard": []})
+    board = game.board
+
+    if top is None and participant is None:
+        etag = game.etag(game.revision)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        return with_etag(jsonify({"leaderboard": leaderboard_entries(board.ordered())}), etag)
+
+    result = {"leaderboard": leaderboard_entries(board.top(top))}
+    if participant is not None:
+        result["participant"] = {
+            "participant": participant,
+            "score": board.scores.get(participant),
+            "rank": board.rank(participant)
+        }
+        result["neighbours"] = leaderboard_entries(board.around(participant, neighbours))
+    return jsonify(result)
 
 
 
@@ -1129,35 +1341,29 @@ def performance_analysis():
     if not game_pin:
         return jsonify({"error": "Game PIN is required"}), 400
 
-    with connect_db() as conn:
-        cursor = conn.cursor()
+    game = games.get(connect_db(), game_pin)
+    return jsonify(performance_summary(game))
 
-        # Fetch participant scores
-        cursor.execute('''
-            SELECT participant, SUM(is_correct) as score
-            FROM responses
-            WHERE game_pin = ?
-            GROUP BY participant
-            ORDER BY score DESC
-        ''', (game_pin,))
-        scores_data = cursor.fetchall()
-
-        participants = [row[0] for row in scores_data]
-        scores = [row[1] for row in scores_data]
-
-        # Fetch correct vs incorrect counts
-        cursor.execute('''
-            SELECT SUM(is_correct), COUNT(*) - SUM(is_correct)
-            FROM responses WHERE game_pin = ?
-        ''', (game_pin,))
-        correct, incorrect = cursor.fetchone()
 
-    return jsonify({
+def performance_summary(game):
+    """Participant scores and answer counts, from the live game state"""
+    scores_data = game.board.ordered() if game else []
+
+    participants = [row[0] for row in scores_data]
+    scores = [row[1] for row in scores_data]
+
+    # Correct vs incorrect counts (None when nobody has answered yet)
+    correct, answered = game.totals() if game else (0, 0)
+    incorrect = answered - correct
+    if not answered:
+        correct = incorrect = None
+
+    return {
         "participants": participants,
         "scores": scores,
         "correct": correct,
         "incorrect": incorrect
-    })
+    }
 
 
 
@@ -1169,27 +1375,25 @@ def most_incorrect_questions():
     if not game_pin:
         return jsonify({"error": "Game PIN is required"}), 400
 
+    answer_buffer.flush()
     with connect_db() as conn:
-        cursor = conn.cursor()
+        incorrect_list = incorrect_questions_summary(conn, game_pin)
 
-        # Total participants who answered at least one question
-        cursor.execute("""
-            SELECT COUNT(DISTINCT participant) FROM responses WHERE game_pin = ?
-        """, (game_pin,))
-        total_participants = cursor.fetchone()[0] or 1  # Avoid division by zero
+    return jsonify({"incorrect_questions": incorrect_list})
 
-        # Fetch incorrect question statistics
-        cursor.execute("""
-            SELECT q.question, q.correct_answer, 
-                   COUNT(*) as total_attempts,
-                   SUM(CASE WHEN r.is_correct = 0 THEN 1 ELSE 0 END) as incorrect_attempts
-            FROM responses r
-            JOIN questions q ON r.question_id = q.id
-            WHERE r.game_pin = ?
-            GROUP BY q.id
-            ORDER BY incorrect_attempts DESC
-        """, (game_pin,))
-        incorrect_questions = cursor.fetchall()
+
+def incorrect_questions_summary(conn, game_pin):
+    """Questions of a game ordered by how often they were answered wrongly"""
+    # Per-question totals are kept in game_question_stats as answers arrive
+    incorrect_questions = conn.execute("""
+        SELECT q.question, q.correct_answer,
+               s.total as total_attempts,
+               s.total - s.correct as incorrect_attempts
+        FROM game_question_stats s
+        JOIN questions q ON s.question_id = q.id
+        WHERE s.game_pin = ?
+        ORDER BY incorrect_attempts DESC
+    """, (game_pin,)).fetchall()
 
     incorrect_list = []
     for q in incorrect_questions:
@@ -1202,7 +1406,7 @@ def most_incorrect_questions():
             "incorrect_percentage": f"{incorrect_percentage:.2f}%"
         })
 
-    return jsonify({"incorrect_questions": incorrect_list})
+    return incorrect_list
 
 
 
@@ -1214,96 +1418,333 @@ def quiz_analysis():
     if not game_pin:
         return jsonify({"error": "Game PIN is required"}), 400
 
+    answer_buffer.flush()
     with connect_db() as conn:
-        cursor = conn.cursor()
+        return jsonify(quiz_analysis_summary(conn, game_pin))
 
-        # Get total participants
-        cursor.execute("""
-            SELECT COUNT(DISTINCT participant) FROM responses WHERE game_pin = ?
-        """, (game_pin,))
-        total_participants = cursor.fetchone()[0] or 1  # Avoid division by zero
 
-        # Get participant scores
-        cursor.execute("""
-            SELECT participant, SUM(is_correct) as score
-            FROM responses WHERE game_pin = ?
-            GROUP BY participant
-        """, (game_pin,))
-        scores = cursor.fetchall()
+def quiz_analysis_summary(conn, game_pin):
+    """Success rate, average score and difficulty of a game"""
+    cursor = conn.cursor()
 
-        # Calculate average score
-        total_score = sum([s[1] for s in scores])
-        average_score = total_score / total_participants if total_participants > 0 else 0
+    # Game-wide totals, maintained by the responses trigger
+    cursor.execute("""
+        SELECT correct, total, participants FROM game_stats WHERE game_pin = ?
+    """, (game_pin,))
+    correct, total_attempts, total_participants = cursor.fetchone() or (0, 0, 0)
+    total_participants = total_participants or 1  # Avoid division by zero
 
-        # Calculate success rate (70% threshold)
-        passing_threshold = 0.7  # 70% passing criteria
-        max_questions = cursor.execute("SELECT COUNT(*) FROM questions WHERE quiz_id = (SELECT quiz_id FROM game_sessions WHERE pin = ?)", (game_pin,)).fetchone()[0]
-        passing_score = max_questions * passing_threshold
+    # Calculate average score
+    average_score = correct / total_participants
 
-        passed_participants = sum(1 for s in scores if s[1] >= passing_score)
-        success_rate = (passed_participants / total_participants) * 100 if total_participants > 0 else 0
+    # Calculate success rate (70% threshold)
+    passing_threshold = 0.7  # 70% passing criteria
+    max_questions = cursor.execute("SELECT COUNT(*) FROM questions WHERE quiz_id = (SELECT quiz_id FROM game_sessions WHERE pin = ?)", (game_pin,)).fetchone()[0]
+    passing_score = max_questions * passing_threshold
 
-        # Determine difficulty level based on incorrect percentage
-        cursor.execute("""
-            SELECT SUM(is_correct), COUNT(*) 
-            FROM responses WHERE game_pin = ?
-        """, (game_pin,))
-        correct, total_attempts = cursor.fetchone()
-        incorrect_percentage = 100 - ((correct / total_attempts) * 100) if total_attempts > 0 else 100
+    passed_participants = cursor.execute("""
+        SELECT COUNT(*) FROM game_participant_stats WHERE game_pin = ? AND correct >= ?
+    """, (game_pin, passing_score)).fetchone()[0]
+    success_rate = (passed_participants / total_participants) * 100
 
-        difficulty_level = "Easy" if incorrect_percentage < 30 else "Medium" if incorrect_percentage < 60 else "Hard"
+    # Determine difficulty level based on incorrect percentage
+    incorrect_percentage = 100 - ((correct / total_attempts) * 100) if total_attempts > 0 else 100
 
-    return jsonify({
+    difficulty_level = "Easy" if incorrect_percentage < 30 else "Medium" if incorrect_percentage < 60 else "Hard"
+
+    return {
         "success_rate": f"{success_rate:.2f}%",
         "average_score": f"{average_score:.2f}",
         "difficulty_level": difficulty_level
-    })
+    }
+
+
+# Sections of /game_report, each the payload of the route of the same name
+REPORT_SECTIONS = ("leaderboard", "performance_analysis", "most_incorrect_questions", "quiz_analysis")
 
 
+@app.route('/game_report', methods=['POST'])
+def game_report():
+    """Everything the host results screen shows, in one response"""
+    data = request.json
+    game_pin = data.get('game_pin')
 
+    if not game_pin:
+        return jsonify({"error": "Game PIN is required"}), 400
 
+    sections = data.get('sections') or REPORT_SECTIONS
+    if isinstance(sections, str):
+        sections = sections.split(",")
+    unknown = [name for name in sections if name not in REPORT_SECTIONS]
+    if unknown:
+        return jsonify({"error": f"Unknown report sections: {', '.join(unknown)}"}), 400
 
+    answer_buffer.flush()
+    with connect_db() as conn:
+        game = games.get(conn, game_pin)
+        if not game:
+            return jsonify({"error": "Invalid Game PIN"}), 404
+
+        # Every section is derived from the game's answers, so the revision
+        # (plus the section list) identifies the report
+        etag = game.etag(f"{game.revision}-{'.'.join(sections)}")
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        report = {}
+        if "leaderboard" in sections:
+            report["leaderboard"] = leaderboard_entries(game.board.ordered())
+        if "performance_analysis" in sections:
+            report["performance_analysis"] = performance_summary(game)
+        if "most_incorrect_questions" in sections:
+            report["most_incorrect_questions"] = incorrect_questions_summary(conn, game_pin)
+        if "quiz_analysis" in sections:
+            report["quiz_analysis"] = quiz_analysis_summary(conn, game_pin)
+
+    return with_etag(jsonify(report), etag)
+
+
+
+
+
+
+# Pre/post pairs accepted by one bulk /compare_training call
+MAX_COMPARE_PAIRS = 1000
+# Pairs per joined query (3 bound parameters each)
+COMPARE_CHUNK = SQL_IN_CHUNK // 3
 
-@app.route('/compare_training', methods=['GET'])
-def compare_training():
-    pre_pin = request.args.get('pre_pin')
-    post_pin = request.args.get('post_pin')
 
-    if not pre_pin or not post_pin:
+@app.route('/compare_training', methods=['GET', 'POST'])
+def compare_training():
+    """Compare pre/post training games.
+
+    GET ?pre_pin=&post_pin= compares one pair. POST {"pairs": [{"pre_pin",
+    "post_pin"}, ...]} compares many at once and adds the statistics over
+    every matched participant. Participants are matched across the two
+    games of a pair by name; "include_participants": true also returns each
+    participant's pre/post scores.
+    """
+    if request.method == 'POST':
+        data = request.json or {}
+        pairs = data.get('pairs') or []
+        include_participants = bool(data.get('include_participants'))
+    else:
+        pairs = [{"pre_pin": request.args.get('pre_pin'), "post_pin": request.args.get('post_pin')}]
+        include_participants = request.args.get('include_participants') == '1'
+
+    if not pairs or not isinstance(pairs, list):
+        return jsonify({"error": "At least one pre/post pair is required!"}), 400
+    if len(pairs) > MAX_COMPARE_PAIRS:
+        return jsonify({"error": f"At most {MAX_COMPARE_PAIRS} pairs per request"}), 400
+    try:
+        pairs = [(int(pair['pre_pin']), int(pair['post_pin'])) for pair in pairs]
+    except (KeyError, TypeError, ValueError):
         return jsonify({"error": "Both Game PINs are required!"}), 400
 
     try:
+        answer_buffer.flush()
         with connect_db() as conn:
-            cursor = conn.cursor()
+            comparisons, all_pre, all_post = training_comparisons(conn, pairs, include_participants)
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+    if request.method == 'GET':
+        comparison = comparisons[0]
+        if "error" in comparison:
+            return jsonify({"error": comparison["error"]}), 404
+        return jsonify({"success": True, **comparison})
+
+    return jsonify({
+        "success": True,
+        "comparisons": comparisons,
+        "overall": score_gains(all_pre, all_post)
+    })
+
 
-            # Get Quiz IDs for both Game PINs
-            cursor.execute("SELECT quiz_id FROM game_sessions WHERE pin = ?", (pre_pin,))
-            pre_quiz = cursor.fetchone()
+def training_comparisons(conn, pairs, include_participants=False):
+    """Per-pair success rates and paired participant gains.
+
+    Returns (comparisons, pre_scores, post_scores), the score lists covering
+    every matched participant of every valid pair. Scores are percentages of
+    the quiz's questions answered correctly.
+    """
+    pins = list(dict.fromkeys(pin for pair in pairs for pin in pair))
+    games_info = {}
+    for start in range(0, len(pins), SQL_IN_CHUNK):
+        chunk = pins[start:start + SQL_IN_CHUNK]
+        rows = conn.execute(f"""
+            SELECT g.pin, (SELECT COUNT(*) FROM questions WHERE quiz_id = g.quiz_id),
+                   IFNULL(s.correct, 0), IFNULL(s.total, 0)
+            FROM game_sessions g LEFT JOIN game_stats s ON s.game_pin = g.pin
+            WHERE g.pin IN ({", ".join("?" * len(chunk))})
+        """, chunk)
+        games_info.update((pin, info) for pin, *info in rows)
+
+    # Every pair's matched participants, one joined query per chunk of pairs
+    matched = [[] for _ in pairs]
+    for start in range(0, len(pairs), COMPARE_CHUNK):
+        chunk = pairs[start:start + COMPARE_CHUNK]
+        values = ", ".join(["(?, ?, ?)"] * len(chunk))
+        params = [value for i, (pre_pin, post_pin) in enumerate(chunk, start) for value in (i, pre_pin, post_pin)]
+        rows = conn.execute(f"""
+            WITH pairs (idx, pre_pin, post_pin) AS (VALUES {values})
+            SELECT p.idx, a.participant, a.correct, a.total, b.correct, b.total
+            FROM pairs p
+            JOIN game_participant_stats a ON a.game_pin = p.pre_pin
+            JOIN game_participant_stats b ON b.game_pin = p.post_pin AND b.participant = a.participant
+            ORDER BY p.idx, a.participant
+        """, params)
+        for idx, *row in rows:
+            matched[idx].append(row)
+
+    comparisons, all_pre, all_post = [], [], []
+    for (pre_pin, post_pin), rows in zip(pairs, matched):
+        comparison = {"pre_pin": pre_pin, "post_pin": post_pin}
+        if pre_pin not in games_info or post_pin not in games_info:
+            comparison["error"] = "Invalid Game PIN(s)!"
+            comparisons.append(comparison)
+            continue
+
+        pre_size, pre_correct, pre_total = games_info[pre_pin]
+        post_size, post_correct, post_total = games_info[post_pin]
+        pre_scores, post_scores, participants = [], [], []
+        for participant, a_correct, a_total, b_correct, b_total in rows:
+            # Quizzes without questions (deleted since) fall back to answers given
+            pre_score = a_correct / (pre_size or a_total) * 100
+            post_score = b_correct / (post_size or b_total) * 100
+            pre_scores.append(pre_score)
+            post_scores.append(post_score)
+            participants.append({"participant": participant, "pre": round(pre_score, 2), "post": round(post_score, 2)})
+        all_pre += pre_scores
+        all_post += post_scores
+
+        comparison["success_rate"] = {
+            "pre": (pre_correct / pre_total) * 100 if pre_total else 0,
+            "post": (post_correct / post_total) * 100 if post_total else 0
+        }
+        comparison["paired"] = score_gains(pre_scores, post_scores)
+        if include_participants:
+            comparison["participants"] = participants
+        comparisons.append(comparison)
+
+    return comparisons, all_pre, all_post
+
+
+def score_gains(pre_scores, post_scores):
+    """Distribution of post - pre gains (percentage points) over matched participants"""
+    if not pre_scores:
+        return {"matched_participants": 0}
+
+    gains = [post - pre for pre, post in zip(pre_scores, post_scores)]
+    # Hake's normalized gain: share of the possible improvement achieved
+    normalized = [(post - pre) / (100 - pre) for pre, post in zip(pre_scores, post_scores) if pre < 100]
+    mean_pre = statistics.fmean(pre_scores)
+    mean_post = statistics.fmean(post_scores)
+    q1, median, q3 = statistics.quantiles(gains, n=4, method="inclusive") if len(gains) > 1 else gains * 3
+
+    return {
+        "matched_participants": len(gains),
+        "mean_pre": round(mean_pre, 2),
+        "mean_post": round(mean_post, 2),
+        "mean_gain": round(statistics.fmean(gains), 2),
+        "normalized_gain": round((mean_post - mean_pre) / (100 - mean_pre), 3) if mean_pre < 100 else None,
+        "mean_normalized_gain": round(statistics.fmean(normalized), 3) if normalized else None,
+        "gain_quantiles": {
+            "min": round(min(gains), 2),
+            "p25": round(q1, 2),
+            "median": round(median, 2),
+            "p75": round(q3, 2),
+            "max": round(max(gains), 2)
+        },
+        "improved": sum(1 for gain in gains if gain > 0),
+        "unchanged": sum(1 for gain in gains if gain == 0),
+        "declined": sum(1 for gain in gains if gain < 0)
+    }
+
+
+
+@app.route('/item_analysis', methods=['GET'])
+def item_analysis():
+    """Item difficulty, discrimination and point-biserial per question, plus
+    Cronbach's alpha, for one game (?game_pin=) or every game of a quiz (?quiz_id=)"""
+    game_pin = request.args.get('game_pin', type=int)
+    quiz_id = request.args.get('quiz_id', type=int)
+
+    if game_pin is None and quiz_id is None:
+        return jsonify({"error": "Game PIN or quiz ID is required"}), 400
+
+    answer_buffer.flush()
+    try:
+        matrix, question_ids = load_matrix(connect_db(), game_pin=game_pin, quiz_id=quiz_id)
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
 
-            cursor.execute("SELECT quiz_id FROM game_sessions WHERE pin = ?", (post_pin,))
-            post_quiz = cursor.fetchone()
+    return jsonify({"success": True, **item_report(matrix, question_ids)})
 
-            if not pre_quiz or not post_quiz:
-                return jsonify({"error": "Invalid Game PIN(s)!"}), 404
 
-            # Fetch Success Rate
-            cursor.execute("SELECT SUM(is_correct), COUNT(*) FROM responses WHERE game_pin = ?", (pre_pin,))
-            pre_correct, pre_total = cursor.fetchone()
 
-            cursor.execute("SELECT SUM(is_correct), COUNT(*) FROM responses WHERE game_pin = ?", (post_pin,))
-            post_correct, post_total = cursor.fetchone()
+# Dimensions of the district rollup that /district_analytics can group by
+DISTRICT_DIMENSIONS = ("district", "quiz_id", "day")
 
-            pre_success_rate = (pre_correct / pre_total) * 100 if pre_total else 0
-            post_success_rate = (post_correct / post_total) * 100 if post_total else 0
 
-        return jsonify({
-            "success": True,
-            "success_rate": {"pre": pre_success_rate, "post": post_success_rate}
-        })
+@app.route('/district_analytics', methods=['GET'])
+def district_analytics():
+    """Participants, attempts, accuracy and pass rate by district, quiz and day.
+
+    Reads the precomputed district_stats cube (see rollups.py). Optional
+    filters: district, quiz_id, date_from, date_to (YYYY-MM-DD).
+    group_by=district,quiz_id,day picks the dimensions to keep; the others
+    are summed over.
+    """
+    group_by = request.args.get('group_by', ",".join(DISTRICT_DIMENSIONS)).split(",")
+    group_by = [name for name in group_by if name]
+    unknown = [name for name in group_by if name not in DISTRICT_DIMENSIONS]
+    if unknown:
+        return jsonify({"error": f"Unknown group_by dimensions: {', '.join(unknown)}"}), 400
 
+    conditions, params = [], []
+    for arg, condition in (("district", "district = ?"), ("quiz_id", "quiz_id = ?"),
+                           ("date_from", "day >= ?"), ("date_to", "day <= ?")):
+        value = request.args.get(arg)
+        if value:
+            conditions.append(condition)
+            params.append(value)
+    if request.args.get('date_from') or request.args.get('date_to'):
+        # Undated (legacy) games sort after every date, keep them out of
+        # ranges; a bound rather than != so the day index covers the range
+        conditions.append("day < ?")
+        params.append(UNKNOWN_DAY)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    columns = ", ".join(group_by)
+
+    try:
+        rows = connect_db().execute(f"""
+            SELECT {columns + ',' if columns else ''}
+                   SUM(games), SUM(participants), SUM(attempts), SUM(correct), SUM(passed)
+            FROM district_stats {where}
+            {'GROUP BY ' + columns + ' ORDER BY ' + columns if columns else ''}
+        """, params).fetchall()
     except sqlite3.Error as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
+    results = []
+    for row in rows:
+        games_count, participants, attempts, correct, passed = row[len(group_by):]
+        if not games_count:
+            continue
+        entry = dict(zip(group_by, row))
+        entry.update({
+            "games": games_count,
+            "participants": participants,
+            "attempts": attempts,
+            "accuracy": round(correct / attempts * 100, 2) if attempts else None,
+            "pass_rate": round(passed / participants * 100, 2) if participants else None
+        })
+        results.append(entry)
+
+    return jsonify({"success": True, "rows": results})
+
 
 
 
@@ -1362,12 +1803,81 @@ def add_new_question():
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (class_level, subject, book_name, chapter, question,
                   option1, option2, option3, option4, correct_answer))
+            question_id = cursor.lastrowid
+            duplicates = index_question(conn, "new_questions", question_id, question, (option1, option2, option3, option4))
             conn.commit()
-        return jsonify({"success": "Question added successfully!"})
+        return jsonify({
+            "success": "Question added successfully!",
+            "id": question_id,
+            "possible_duplicates": duplicates
+        })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/import_questions", methods=["POST"])
+def import_questions():
+    """Bulk load questions from an uploaded CSV or JSONL file.
+
+    Multipart field "file", or the raw request body with format given.
+    Query/form parameters: table ("questions", the default, or
+    "new_questions") and format ("csv" or "jsonl", default from the file
+    name). CSV needs a header row with the column names. Valid rows are
+    imported even when others are rejected; the response lists the errors.
+    """
+    upload = request.files.get("file")
+    table = request.values.get("table", "questions")
+    fmt = request.values.get("format") or detect_format(upload.filename if upload else None)
+    if fmt is None:
+        return jsonify({"error": "format is required (csv or jsonl)"}), 400
+
+    # Read straight from the (spooled) upload, never the whole file at once
+    stream = io.TextIOWrapper(upload.stream if upload else request.stream, encoding="utf-8-sig", newline="")
+    try:
+        with pooled_connection() as conn:
+            result = import_question_rows(conn, stream, fmt, table)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+    print(f"✅ Imported {result['imported']} questions into {table}, rejected {result['rejected']}")
+    return jsonify({"success": True, **result})
+
+
+@app.route("/export_questions", methods=["GET"])
+def export_questions():
+    """Download questions as CSV or JSONL, streamed as they are read.
+
+    Query parameters: format ("csv", the default, or "jsonl"), table
+    ("questions", the default, or "new_questions"), and optional
+    class_level / subject / book_name / chapter / quiz_id filters.
+    """
+    fmt = request.args.get("format", "csv")
+    table = request.args.get("table", "questions")
+    if fmt not in FORMATS:
+        return jsonify({"error": f"Unknown format: {fmt}"}), 400
+    filters = {column: request.args[column] for column in EXPORT_FILTERS if request.args.get(column)}
+    quiz_id = request.args.get("quiz_id")
+    try:
+        quiz_id = int(quiz_id) if quiz_id else None
+    except ValueError:
+        return jsonify({"error": "quiz_id must be an integer"}), 400
+    try:
+        query = export_query(table, filters, quiz_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def stream():
+        # The request's connection is released before the body is sent
+        with pooled_connection() as conn:
+            yield from export_question_rows(conn, fmt, query)
+
+    return Response(stream(), mimetype=CONTENT_TYPES[fmt], headers={
+        "Content-Disposition": f"attachment; filename={table}.{fmt}"
+    })
+
+
 
 
 
@@ -1417,6 +1927,5 @@ def serve_static(filename):
     return send_from_directory('static', filename)
 
 if __name__ == "__main__":
-    init_new_questions_table()
     app.run(debug=True, port=5012)
 
@@ -0,0 +1,69 @@
+import threading
+
+
+class QuestionCatalog:
+    """In-process class -> subject -> book -> chapter tree of the questions table.
+
+    Built with one GROUP BY over the catalog index and kept until the
+    questions change. Triggers bump cache_versions.catalog on every insert,
+    delete or re-shelving of a question, whichever process or CLI made it,
+    so each read costs a single primary key lookup to confirm the tree is
+    current.
+    """
+
+    def __init__(self):
+        # (version, tree, books per (class, subject), chapters per (class, subject, book))
+        self._snapshot = (None, [], {}, {})
+        self._lock = threading.Lock()
+
+    def _current(self, conn):
+        row = conn.execute("SELECT version FROM cache_versions WHERE name = 'catalog'").fetchone()
+        version = row[0] if row else 0
+        snapshot = self._snapshot
+        if snapshot[0] != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot[0] != version:
+                    snapshot = self._snapshot = self._build(conn, version)
+        return snapshot
+
+    def _build(self, conn, version):
+        rows = conn.execute('''
+            SELECT class_level, subject, book_name, chapter, COUNT(*) FROM questions
+            GROUP BY class_level, subject, book_name, chapter
+            ORDER BY class_level, subject, book_name, chapter
+        ''').fetchall()
+        tree, books, chapters = [], {}, {}
+        for class_level, subject, book_name, chapter, count in rows:
+            if not tree or tree[-1]["class_level"] != class_level:
+                tree.append({"class_level": class_level, "questions": 0, "subjects": []})
+            subjects = tree[-1]["subjects"]
+            if not subjects or subjects[-1]["subject"] != subject:
+                subjects.append({"subject": subject, "questions": 0, "books": []})
+            shelf = subjects[-1]["books"]
+            if not shelf or shelf[-1]["book_name"] != book_name:
+                shelf.append({"book_name": book_name, "questions": 0, "chapters": []})
+                books.setdefault((class_level, subject), []).append(book_name)
+            shelf[-1]["chapters"].append({"chapter": chapter, "questions": count})
+            chapters.setdefault((class_level, subject, book_name), []).append(chapter)
+            for node in (tree[-1], subjects[-1], shelf[-1]):
+                node["questions"] += count
+        return version, tree, books, chapters
+
+    def tree(self, conn):
+        """(version, tree) with question counts at every level"""
+        version, tree, _, _ = self._current(conn)
+        return version, tree
+
+    def books(self, conn, class_level, subject):
+        return self._current(conn)[2].get((class_level, subject), [])
+
+    def chapters(self, conn, class_level, subject, book_name=None):
+        """Chapters of one book, or of every book of a subject when book_name is None"""
+        _, _, books, chapters = self._current(conn)
+        if book_name is not None:
+            return chapters.get((class_level, subject, book_name), [])
+        return list(dict.fromkeys(
+            chapter for book in books.get((class_level, subject), [])
+            for chapter in chapters[(class_level, subject, book)]
+        ))
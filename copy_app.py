@@ -5,6 +5,7 @@ import google.generativeai as genai
 import PyPDF2, docx
 import os
 from datetime import datetime
+from migrations import migrate
 
 app = Flask(__name__)
 
@@ -105,107 +106,8 @@ def connect_db():
 
 
 
-def init_new_questions_table():
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS new_questions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                class_level TEXT NOT NULL,
-                subject TEXT NOT NULL,
-                book_name TEXT NOT NULL,
-                chapter TEXT NOT NULL,
-                question TEXT NOT NULL,
-                option1 TEXT NOT NULL,
-                option2 TEXT NOT NULL,
-                option3 TEXT NOT NULL,
-                option4 TEXT NOT NULL,
-                correct_answer TEXT NOT NULL
-            )
-        ''')
-        conn.commit()
-
-
-# Create a table for quizzes
-# Create a table for quizzes
-def create_table():
-    with connect_db() as conn:
-        cursor = conn.cursor()
-        
-        # Create quizzes table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS quizzes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                category TEXT NOT NULL
-            )
-        ''')
-
-        # Create questions table
-        # ✅ Modified questions table schema:
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS questions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                quiz_id INTEGER,  -- ✅ Optional, can be NULL
-                class_level TEXT NOT NULL,
-                subject TEXT NOT NULL,
-                book_name TEXT NOT NULL,
-                chapter TEXT NOT NULL,  -- ✅ Newly added field
-                question TEXT NOT NULL,
-                option1 TEXT NOT NULL,
-                option2 TEXT NOT NULL,
-                option3 TEXT NOT NULL,
-                option4 TEXT NOT NULL,
-                correct_answer TEXT NOT NULL,
-                FOREIGN KEY (quiz_id) REFERENCES quizzes(id)
-            )
-        ''')
-
-        # Create game_sessions table with current_question_index
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS game_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                quiz_id INTEGER NOT NULL,
-                pin INTEGER NOT NULL,
-                status TEXT DEFAULT "active",
-                current_question_index INTEGER DEFAULT 0,
-                FOREIGN KEY (quiz_id) REFERENCES quizzes(id)
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS participants (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                player_name TEXT NOT NULL,
-                phone_number TEXT NOT NULL,
-                email_id TEXT NOT NULL,
-                district TEXT NOT NULL,
-                game_pin INTEGER NOT NULL
-            )
-        ''')
-
-        # Create responses table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS responses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                game_pin INTEGER NOT NULL,
-                question_id INTEGER NOT NULL,
-                participant TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                is_correct INTEGER NOT NULL,
-                FOREIGN KEY (question_id) REFERENCES questions(id)
-            )
-        ''')
-
-        # Add current_question_index to existing tables if it doesn't exist
-        try:
-            cursor.execute("SELECT current_question_index FROM game_sessions LIMIT 1")
-        except sqlite3.OperationalError:
-            cursor.execute("ALTER TABLE game_sessions ADD COLUMN current_question_index INTEGER DEFAULT 0")
-            
-        conn.commit()
-
-create_table()
+# Apply any pending schema migrations once at startup
+migrate()
 
 
 
@@ -321,14 +223,6 @@ def join_quiz():
         if not game:
             return jsonify({"error": "Invalid or inactive game PIN!"}), 400
 
-        # Check if the started_for_all column exists in game_sessions table
-        try:
-            cursor.execute("SELECT started_for_all FROM game_sessions WHERE pin = ?", (game_pin,))
-        except sqlite3.OperationalError:
-            # Column doesn't exist, add it
-            cursor.execute("ALTER TABLE game_sessions ADD COLUMN started_for_all INTEGER DEFAULT 0")
-            conn.commit()
-
         # Check if the quiz has already started for all
         cursor.execute("SELECT started_for_all FROM game_sessions WHERE pin = ?", (game_pin,))
         started = cursor.fetchone()[0]
@@ -964,28 +858,6 @@ def start_quiz():
     with connect_db() as conn:
         cursor = conn.cursor()
         
-        # Ensure tables exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS game_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                quiz_id INTEGER NOT NULL,
-                pin INTEGER NOT NULL,
-                status TEXT DEFAULT "active",
-                FOREIGN KEY (quiz_id) REFERENCES quizzes(id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS responses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                game_pin INTEGER NOT NULL,
-                question_id INTEGER NOT NULL,
-                participant TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                is_correct INTEGER NOT NULL
-            )
-        ''')
-        conn.commit()
-
         # 🛑 **Fix: Insert the new game session into `game_sessions`**
         cursor.execute('''
             INSERT INTO game_sessions (quiz_id, pin, status) VALUES (?, ?, 'active')
@@ -1328,6 +1200,5 @@ def serve_static(filename):
     return send_from_directory('static', filename)
 
 if __name__ == "__main__":
-    init_new_questions_table()
     app.run(debug=True, port=5012)
 
@@ -0,0 +1,116 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+
+# Path to the SQLite database
+DB_PATH = os.environ.get("DATABASE_PATH", "database.db")
+# Connections open at once; further requests wait up to POOL_TIMEOUT seconds
+# for one to be returned rather than opening (and configuring) their own
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "16"))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+
+# Applied once when a connection is opened, so requests never pay for them
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",  # ~16 MB page cache per connection
+    "PRAGMA mmap_size = 268435456",  # 256 MB memory-mapped reads
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+def open_connection(path=None):
+    """Open a new SQLite connection with the standard PRAGMAs applied"""
+    conn = sqlite3.connect(path or DB_PATH, check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Keeps up to size configured connections open and hands them out one at a time.
+
+    acquire() blocks while all of them are in use and raises
+    sqlite3.OperationalError if none is returned within timeout seconds.
+    """
+
+    def __init__(self, path, size, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError("connection pool exhausted")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return open_connection(self.path)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        # Never hand out a connection with a half-finished transaction
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pool = ConnectionPool(DB_PATH, POOL_SIZE)
+
+
+def pooled_connection():
+    """Context manager for code running outside a request (startup, workers)"""
+    return _pool.connection()
+
+
+def connect_db():
+    """Return the pooled connection bound to the current request.
+
+    The same connection is reused for the whole request and returned to the
+    pool by the teardown handler registered in init_app(). Outside of an
+    application context a fresh configured connection is returned instead.
+    """
+    if not has_app_context():
+        return open_connection()
+    if "db" not in g:
+        g.db = _pool.acquire()
+    return g.db
+
+
+def release_db(exc=None):
+    conn = g.pop("db", None)
+    if conn is not None:
+        _pool.release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db)
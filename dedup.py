@@ -0,0 +1,267 @@
+import itertools
+import re
+
+import click
+import numpy as np
+
+from db import pooled_connection
+
+# Question banks covered by the near-duplicate index
+SOURCES = ("questions", "new_questions")
+
+# Character shingles of the normalized question and options
+SHINGLE_SIZE = 4
+
+# MinHash signatures of BANDS * ROWS values, split into LSH bands. Two
+# questions share a band bucket with probability 1 - (1 - J^ROWS)^BANDS,
+# i.e. ~99.9% at Jaccard similarity 0.8 and ~10% at 0.3
+BANDS = 16
+ROWS = 4
+PERMUTATIONS = BANDS * ROWS
+
+# Estimated Jaccard similarity from which two questions count as duplicates
+DUPLICATE_THRESHOLD = 0.8
+MAX_REPORTED = 5
+
+# Questions hashed per numpy pass; bounds the shingles x permutations array
+SIGNATURE_BATCH = 250
+
+# Multiply-shift hashing of 32-bit shingle hashes: the high 32 bits of
+# (a * x + b) mod 2^64, one odd a and one b per permutation
+_rng = np.random.default_rng(2_718_281)
+_A = (_rng.integers(0, 1 << 63, PERMUTATIONS, dtype=np.uint64) | np.uint64(1))[:, None]
+_B = _rng.integers(0, 1 << 63, PERMUTATIONS, dtype=np.uint64)[:, None]
+# Odd multipliers folding a band's values into one bucket key
+_BAND_MIX = _rng.integers(0, 1 << 63, ROWS, dtype=np.uint64) | np.uint64(1)
+_FNV_PRIME = np.uint32(0x01000193)
+
+
+def _normalize(question, options):
+    # Option order does not make a question different
+    text = " ".join([question or ""] + sorted(option or "" for option in options))
+    return re.sub(r"\W+", " ", text.lower()).strip()
+
+
+def signatures(questions):
+    """signature() of many (question, options) pairs, vectorized over all their shingles"""
+    texts = [_normalize(question, options) for question, options in questions]
+    result = [None] * len(texts)
+    rows = [i for i, text in enumerate(texts) if text]
+    for start in range(0, len(rows), SIGNATURE_BATCH):
+        batch = rows[start:start + SIGNATURE_BATCH]
+        codes = [np.frombuffer(texts[i].ljust(SHINGLE_SIZE, "\0").encode("utf-32-le"), dtype=np.uint32)
+                 for i in batch]
+        windows = np.array([len(c) - SHINGLE_SIZE + 1 for c in codes])
+        first_window = np.cumsum(windows) - windows
+        # Start of every shingle in the concatenated characters
+        offsets = np.cumsum([0] + [len(c) for c in codes[:-1]])
+        starts = np.repeat(offsets - first_window, windows) + np.arange(windows.sum())
+        chars = np.concatenate(codes)
+        shingles = np.zeros(len(starts), dtype=np.uint32)
+        for k in range(SHINGLE_SIZE):
+            shingles = (shingles ^ chars[starts + k]) * _FNV_PRIME
+        # permutations x shingles, so each question's minimum is a contiguous reduction
+        hashed = (_A * shingles.astype(np.uint64) + _B) >> np.uint64(32)
+        minima = np.minimum.reduceat(hashed, first_window, axis=1).T.astype(np.uint32)
+        for i, sig in zip(batch, minima):
+            result[i] = sig
+    return result
+
+
+def signature(question, options):
+    """MinHash signature (uint32 array) of a question and its options, or None if it has no text"""
+    return signatures([(question, options)])[0]
+
+
+def band_keys(sigs):
+    """Signed 64-bit bucket key of every LSH band, for an n x PERMUTATIONS array of signatures"""
+    bands = sigs.astype(np.uint64).reshape(-1, BANDS, ROWS) * _BAND_MIX
+    return bands.sum(axis=2, dtype=np.uint64).view(np.int64)
+
+
+def band_buckets(sig):
+    """One bucket key per LSH band of a single signature"""
+    return band_keys(sig[None, :])[0].tolist()
+
+
+def add_signature(conn, source, question_id, sig):
+    """Store a question's signature and band buckets; the caller commits"""
+    if sig is not None:
+        _store(conn, source, [question_id], sig[None, :])
+
+
+def add_signatures(conn, source, rows):
+    """add_signature() for a batch of questions, given as (id, question, options) rows"""
+    indexed = [(row[0], sig) for row, sig in zip(rows, signatures([row[1:] for row in rows])) if sig is not None]
+    if indexed:
+        question_ids, sigs = zip(*indexed)
+        _store(conn, source, question_ids, np.stack(sigs))
+
+
+def _store(conn, source, question_ids, sigs):
+    conn.executemany(
+        "INSERT OR REPLACE INTO question_signatures (source, question_id, signature) VALUES (?, ?, ?)",
+        [(source, question_id, sig.tobytes()) for question_id, sig in zip(question_ids, sigs)]
+    )
+    # A re-indexed question may leave its old buckets behind; they are
+    # harmless since lookups compare the current signature. Inserting in key
+    # order touches each b-tree page once.
+    buckets = band_keys(sigs).ravel()
+    bands = np.tile(np.arange(BANDS), len(question_ids))
+    ids = np.repeat(np.asarray(question_ids, dtype=np.int64), BANDS)
+    order = np.lexsort((ids, buckets, bands))
+    conn.executemany(
+        "INSERT OR IGNORE INTO question_lsh (band, bucket, source, question_id) VALUES (?, ?, ?, ?)",
+        zip(bands[order].tolist(), buckets[order].tolist(), itertools.repeat(source), ids[order].tolist())
+    )
+
+
+def find_duplicates(conn, sig, threshold=DUPLICATE_THRESHOLD, limit=MAX_REPORTED):
+    """Indexed questions whose estimated similarity to sig is at least threshold.
+
+    Only questions sharing at least one band bucket are compared, so the
+    cost depends on the number of near matches rather than the bank size.
+    Returns up to limit dicts (source, id, question, similarity), most
+    similar first.
+    """
+    if sig is None:
+        return []
+    buckets = band_buckets(sig)
+    candidates = conn.execute(f'''
+        SELECT s.source, s.question_id, s.signature FROM question_signatures s
+        WHERE (s.source, s.question_id) IN (
+            SELECT source, question_id FROM question_lsh
+            WHERE {" OR ".join(["(band = ? AND bucket = ?)"] * BANDS)}
+        )
+    ''', [value for band, bucket in enumerate(buckets) for value in (band, bucket)]).fetchall()
+    if not candidates:
+        return []
+
+    signatures = np.frombuffer(b"".join(row[2] for row in candidates), dtype=np.uint32).reshape(-1, PERMUTATIONS)
+    similarity = (signatures == sig).mean(axis=1)
+    ranked = [i for i in np.argsort(-similarity, kind="stable") if similarity[i] >= threshold][:limit]
+
+    duplicates = []
+    for i in ranked:
+        source, question_id = candidates[i][0], candidates[i][1]
+        row = conn.execute(f"SELECT question FROM {source} WHERE id = ?", (question_id,)).fetchone()
+        if row:
+            duplicates.append({
+                "source": source,
+                "id": question_id,
+                "question": row[0],
+                "similarity": round(float(similarity[i]), 3)
+            })
+    return duplicates
+
+
+def index_question(conn, source, question_id, question, options):
+    """Report likely duplicates of a newly inserted question, then index it.
+
+    Returns find_duplicates() for the question (itself excluded, since it is
+    not indexed yet). The caller commits.
+    """
+    sig = signature(question, options)
+    duplicates = find_duplicates(conn, sig)
+    add_signature(conn, source, question_id, sig)
+    return duplicates
+
+
+def index_missing(conn):
+    """Index every question not in the index yet (new, edited or pre-existing); returns the count"""
+    count = 0
+    for source in SOURCES:
+        rows = conn.execute(f'''
+            SELECT t.id, t.question, t.option1, t.option2, t.option3, t.option4 FROM {source} t
+            WHERE NOT EXISTS (
+                SELECT 1 FROM question_signatures s WHERE s.source = ? AND s.question_id = t.id
+            )
+        ''', (source,)).fetchall()
+        add_signatures(conn, source, [(question_id, question, options) for question_id, question, *options in rows])
+        count += len(rows)
+    return count
+
+
+def rebuild_index(conn):
+    """Drop and recompute the whole index, including buckets left behind by edits; returns the count"""
+    conn.execute("DELETE FROM question_lsh")
+    conn.execute("DELETE FROM question_signatures")
+    return index_missing(conn)
+
+
+def cluster(conn, threshold=DUPLICATE_THRESHOLD):
+    """Group the whole bank into near-duplicate clusters.
+
+    Identical signatures (verbatim copies) collapse first; the remaining
+    distinct ones are compared pairwise only within shared LSH bands and
+    joined with union-find. Each question in a cluster of two or more gets
+    cluster_source / cluster_id set to the cluster's first question
+    (questions before new_questions, then lowest id); the others are
+    cleared. The caller commits. Returns the clusters, largest first, as
+    lists of (source, id).
+    """
+    rows = conn.execute(
+        "SELECT source, question_id, signature FROM question_signatures ORDER BY source DESC, question_id"
+    ).fetchall()  # DESC puts 'questions' before 'new_questions'
+    if not rows:
+        return []
+    signatures = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.uint32).reshape(-1, PERMUTATIONS)
+    distinct, inverse = np.unique(signatures, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+
+    parent = list(range(len(distinct)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(BANDS):
+        _, bucket = np.unique(distinct[:, band * ROWS:(band + 1) * ROWS], axis=0, return_inverse=True)
+        bucket = bucket.ravel()
+        order = np.argsort(bucket, kind="stable")
+        starts = np.flatnonzero(np.diff(bucket[order], prepend=-1))
+        for members in np.split(order, starts[1:]):
+            if len(members) < 2:
+                continue
+            group = distinct[members]
+            similarity = (group[:, None, :] == group[None, :, :]).mean(axis=2)
+            for i, j in zip(*np.nonzero(np.triu(similarity >= threshold, k=1))):
+                root_i, root_j = find(members[i]), find(members[j])
+                if root_i != root_j:
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    clusters = {}
+    for row, distinct_index in zip(rows, inverse):
+        clusters.setdefault(find(distinct_index), []).append((row[0], row[1]))
+    clusters = sorted((c for c in clusters.values() if len(c) > 1), key=len, reverse=True)
+
+    conn.execute("UPDATE question_signatures SET cluster_source = NULL, cluster_id = NULL WHERE cluster_id IS NOT NULL")
+    conn.executemany(
+        "UPDATE question_signatures SET cluster_source = ?, cluster_id = ? WHERE source = ? AND question_id = ?",
+        [(c[0][0], c[0][1], source, question_id) for c in clusters for source, question_id in c]
+    )
+    return clusters
+
+
+@click.command("dedup-questions")
+@click.option("--threshold", type=float, default=DUPLICATE_THRESHOLD, show_default=True,
+              help="Estimated Jaccard similarity from which questions are duplicates.")
+@click.option("--rebuild", is_flag=True, help="Recompute every signature instead of only missing ones.")
+def dedup_questions_command(threshold, rebuild):
+    """Cluster near-duplicate questions across the question banks."""
+    with pooled_connection() as conn:
+        with conn:
+            indexed = rebuild_index(conn) if rebuild else index_missing(conn)
+            clusters = cluster(conn, threshold)
+        click.echo(f"✅ Indexed {indexed} questions")
+        for members in clusters[:10]:
+            source, question_id = members[0]
+            question = conn.execute(f"SELECT question FROM {source} WHERE id = ?", (question_id,)).fetchone()[0]
+            click.echo(f"  {len(members)} x {question[:70]!r}")
+    click.echo(f"✅ {len(clusters)} clusters covering {sum(map(len, clusters))} questions")
+
+
+def init_app(app):
+    app.cli.add_command(dedup_questions_command)
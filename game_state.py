@@ -0,0 +1,351 @@
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from itertools import islice
+
+from leaderboard import Leaderboard
+
+# Game phases
+WAITING = "waiting"
+STARTED = "started"
+ENDED = "ended"
+
+# Events pushed to subscribers (see /game_events in app.py)
+STARTED_EVENT = "started"
+QUESTION_CHANGED_EVENT = "question_changed"
+GAME_ENDED_EVENT = "game_ended"
+
+# Games kept in memory at once; evicted games are rebuilt from SQLite on demand
+MAX_GAMES = 1000
+
+
+class Player:
+    __slots__ = ("player_name", "phone_number", "email_id", "district", "join_time")
+
+    def __init__(self, player_name, phone_number, email_id, district, join_time=None):
+        self.player_name = player_name
+        self.phone_number = phone_number
+        self.email_id = email_id
+        self.district = district
+        self.join_time = join_time or datetime.now().strftime("%H:%M:%S")
+
+    def to_dict(self):
+        return {
+            "player_name": self.player_name,
+            "phone_number": self.phone_number,
+            "email_id": self.email_id,
+            "district": self.district,
+            "join_time": self.join_time,
+        }
+
+
+class QuestionStats:
+    __slots__ = ("answered", "correct", "answers")
+
+    def __init__(self, answered=0, correct=0, answers=None):
+        self.answered = answered
+        self.correct = correct
+        self.answers = answers or {}  # answer text -> number of participants who gave it
+
+    def histogram(self, options):
+        """[(option, count)] for the question's options, in order, plus the uncounted rest.
+
+        An answer is credited to the first option it matches, as in
+        game_question_stats.
+        """
+        counts = []
+        seen = set()
+        for option in options:
+            counts.append((option, 0 if option in seen else self.answers.get(option, 0)))
+            seen.add(option)
+        other = self.answered - sum(count for _, count in counts)
+        return counts, other
+
+
+class GameState:
+    """Live state of one game, served to the polling routes from memory"""
+
+    __slots__ = ("pin", "quiz_id", "status", "phase", "current_question_index",
+                 "waiting", "roster", "board", "questions", "lock",
+                 "version", "listeners", "waiters", "changed", "revision", "epoch")
+
+    def __init__(self, pin, quiz_id, status="active"):
+        self.pin = pin
+        self.quiz_id = quiz_id
+        self.status = status
+        self.phase = WAITING
+        self.current_question_index = 0
+        self.waiting = []  # Players who joined before the host started the quiz
+        self.roster = {}  # player_name -> Player, once admitted to the game
+        self.board = Leaderboard()  # participant -> number of correct answers, ranked
+        self.questions = {}  # str(question_id) -> QuestionStats
+        self.lock = threading.Lock()
+        self.version = 0  # Bumped on every phase event
+        self.listeners = []  # One queue per open event stream
+        self.waiters = 0  # Long-poll requests blocked in wait_for_change()
+        self.changed = threading.Condition(self.lock)  # Notified on every phase event
+        self.revision = 0  # Bumped on every change at all (joins and answers too)
+        # Distinguishes this in-memory copy from earlier ones, whose counters
+        # restarted from zero, so ETags built from it never collide
+        self.epoch = format(time.time_ns(), "x")
+
+    @property
+    def is_active(self):
+        return self.status == "active"
+
+    def totals(self):
+        """(correct, answered) over every response in the game"""
+        correct = answered = 0
+        for stats in self.questions.values():
+            correct += stats.correct
+            answered += stats.answered
+        return correct, answered
+
+    def etag(self, counter):
+        """Opaque validator for a response derived from version or revision"""
+        return f"{self.pin}-{self.epoch}-{counter}"
+
+    def snapshot(self):
+        return {
+            "phase": self.phase,
+            "current_question_index": self.current_question_index,
+            "version": self.version,
+        }
+
+
+class GameRegistry:
+    """Owns every GameState in this process.
+
+    Mutations update memory and are persisted to SQLite: phase changes are
+    appended to game_events (and mirrored into game_sessions for older
+    clients), answers land in responses via the answer buffer. A game that is
+    not in memory, e.g. after a restart, is rebuilt by replaying its events
+    and reading its answer statistics. State is per process, so the app must run
+    as a single worker; it is a gevent worker (see Procfile) so that event
+    streams and long-polls wait on greenlets rather than pool threads.
+    """
+
+    def __init__(self, before_rebuild=None, max_games=MAX_GAMES):
+        self.max_games = max_games
+        # Called before rebuilding from SQLite, e.g. to flush buffered answers
+        self.before_rebuild = before_rebuild
+        self._games = OrderedDict()
+        self._lock = threading.Lock()
+        # PIN -> lock held while that game is rebuilt, so concurrent first
+        # requests wait for one rebuild instead of each making their own copy
+        self._loading = {}
+
+    def create(self, conn, game_pin, quiz_id):
+        game = GameState(str(game_pin), quiz_id)
+        self._log(conn, game.pin, "created", {"quiz_id": quiz_id})
+        conn.commit()
+        self._remember(game)
+        return game
+
+    def get(self, conn, game_pin):
+        """Return the GameState for a PIN, or None if no such game exists"""
+        pin = str(game_pin)
+        game = self._cached(pin)
+        if game is not None:
+            return game
+
+        with self._lock:
+            loading = self._loading.setdefault(pin, threading.Lock())
+        try:
+            with loading:
+                game = self._cached(pin)
+                if game is None:
+                    game = self._rebuild(conn, pin)
+                    if game is not None:
+                        self._remember(game)
+                return game
+        finally:
+            with self._lock:
+                if self._loading.get(pin) is loading:
+                    del self._loading[pin]
+
+    def join(self, conn, game, player):
+        """Add a player; returns True if they were admitted straight into the game"""
+        with game.lock:
+            if game.phase == STARTED:
+                self._insert_participants(conn, game.pin, [player])
+                conn.commit()
+                game.roster[player.player_name] = player
+                game.revision += 1
+                return True
+            game.waiting.append(player)
+            game.revision += 1
+            self._log(conn, game.pin, "joined", player.to_dict())
+            conn.commit()
+            return False
+
+    def start_for_all(self, conn, game):
+        """Admit everyone on the waiting list; returns how many were admitted"""
+        with game.lock:
+            admitted = list(game.waiting)
+            self._insert_participants(conn, game.pin, admitted)
+            conn.execute("UPDATE game_sessions SET started_for_all = 1 WHERE pin = ?", (game.pin,))
+            self._log(conn, game.pin, "started", {"admitted": len(admitted)})
+            conn.commit()
+            for player in admitted:
+                game.roster[player.player_name] = player
+            game.waiting = []
+            game.phase = STARTED
+            self._publish(game, STARTED_EVENT, {"participants_count": len(admitted)})
+            return len(admitted)
+
+    def move_to_question(self, conn, game, index):
+        with game.lock:
+            conn.execute("UPDATE game_sessions SET current_question_index = ? WHERE pin = ?", (index, game.pin))
+            self._log(conn, game.pin, "question", {"index": index})
+            conn.commit()
+            game.current_question_index = index
+            self._publish(game, QUESTION_CHANGED_EVENT, {"index": index})
+
+    def end(self, conn, game):
+        with game.lock:
+            conn.execute("UPDATE game_sessions SET status = 'ended' WHERE pin = ?", (game.pin,))
+            self._log(conn, game.pin, "ended", {})
+            conn.commit()
+            game.status = ENDED
+            game.phase = ENDED
+            self._publish(game, GAME_ENDED_EVENT, {})
+
+    def subscribe(self, game):
+        """Return a queue that receives (version, event, data) for the game"""
+        listener = queue.Queue()
+        with game.lock:
+            game.listeners.append(listener)
+        return listener
+
+    def wait_for_change(self, game, since_version, timeout):
+        """Block until the game's version passes since_version or timeout expires"""
+        with game.changed:
+            game.waiters += 1
+            try:
+                game.changed.wait_for(lambda: game.version > since_version, timeout)
+            finally:
+                game.waiters -= 1
+            return game.version
+
+    def unsubscribe(self, game, listener):
+        with game.lock:
+            if listener in game.listeners:
+                game.listeners.remove(listener)
+
+    def record_answer(self, game, participant, question_id, answer, is_correct):
+        with game.lock:
+            game.board.add(participant, is_correct)
+            stats = game.questions.get(str(question_id))
+            if stats is None:
+                stats = game.questions[str(question_id)] = QuestionStats()
+            stats.answered += 1
+            stats.correct += is_correct
+            stats.answers[answer] = stats.answers.get(answer, 0) + 1
+            game.revision += 1
+
+    def _publish(self, game, event, data):
+        # Called with game.lock held
+        game.version += 1
+        game.revision += 1
+        for listener in game.listeners:
+            listener.put_nowait((game.version, event, data))
+        game.changed.notify_all()
+
+    def _cached(self, pin):
+        with self._lock:
+            game = self._games.get(pin)
+            if game is not None:
+                self._games.move_to_end(pin)
+            return game
+
+    def _remember(self, game):
+        with self._lock:
+            self._games[game.pin] = game
+            self._games.move_to_end(game.pin)
+            # Least recently used first, but never a game someone is still
+            # streaming or long-polling: a rebuilt copy would not wake them
+            excess = len(self._games) - self.max_games
+            if excess > 0:
+                idle = (pin for pin, old in self._games.items() if not (old.listeners or old.waiters))
+                for pin in list(islice(idle, excess)):
+                    del self._games[pin]
+
+    def _insert_participants(self, conn, pin, players):
+        conn.executemany(
+            "INSERT INTO participants (player_name, phone_number, email_id, district, game_pin) VALUES (?, ?, ?, ?, ?)",
+            [(p.player_name, p.phone_number, p.email_id, p.district, pin) for p in players]
+        )
+
+    def _log(self, conn, pin, event, payload):
+        conn.execute(
+            "INSERT INTO game_events (game_pin, event, payload, created_at) VALUES (?, ?, ?, ?)",
+            (pin, event, json.dumps(payload), datetime.now().isoformat(timespec="seconds"))
+        )
+
+    def _rebuild(self, conn, pin):
+        session = conn.execute(
+            "SELECT quiz_id, status, started_for_all, current_question_index FROM game_sessions WHERE pin = ?",
+            (pin,)
+        ).fetchone()
+        if not session:
+            return None
+        if self.before_rebuild is not None:
+            self.before_rebuild()
+
+        quiz_id, status, started_for_all, current_question_index = session
+        game = GameState(pin, quiz_id, status)
+        # Games that predate the event log only have the game_sessions columns
+        if status == ENDED:
+            game.phase = ENDED
+        elif started_for_all == 1:
+            game.phase = STARTED
+        else:
+            game.phase = WAITING
+        game.current_question_index = current_question_index or 0
+
+        events = conn.execute(
+            "SELECT event, payload FROM game_events WHERE game_pin = ? ORDER BY id", (pin,)
+        )
+        for event, payload in events:
+            data = json.loads(payload) if payload else {}
+            if event == "joined":
+                game.waiting.append(Player(**data))
+            elif event == "started":
+                game.waiting = []
+                game.phase = STARTED
+                game.version += 1
+            elif event == "question":
+                game.current_question_index = data["index"]
+                game.version += 1
+            elif event == "ended":
+                game.phase = ENDED
+                game.version += 1
+
+        players = conn.execute(
+            "SELECT player_name, phone_number, email_id, district FROM participants WHERE game_pin = ?", (pin,)
+        )
+        for row in players:
+            game.roster[row[0]] = Player(*row, join_time="")
+
+        scores = conn.execute(
+            "SELECT participant, correct FROM game_participant_stats WHERE game_pin = ?", (pin,)
+        )
+        game.board.load(scores)
+        per_question = conn.execute(
+            "SELECT s.question_id, s.total, s.correct, "
+            "q.option1, s.option1, q.option2, s.option2, q.option3, s.option3, q.option4, s.option4 "
+            "FROM game_question_stats s LEFT JOIN questions q ON q.id = s.question_id WHERE s.game_pin = ?",
+            (pin,)
+        )
+        for question_id, answered, correct, *option_counts in per_question:
+            # Answers outside the options are only kept as a total
+            answers = {}
+            for option, count in zip(option_counts[::2], option_counts[1::2]):
+                if option is not None and count:
+                    answers[option] = count
+            game.questions[str(question_id)] = QuestionStats(answered, correct, answers)
+        return game
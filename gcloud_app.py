@@ -4,9 +4,11 @@ import random
 import google.generativeai as genai
 import PyPDF2, docx
 import os
+from contextlib import closing
 from datetime import datetime
 from flask_cors import CORS
 from google.cloud import storage
+from migrations import migrate
 
 app = Flask(__name__)
 CORS(app)  # Add this line after initializing your Flask app
@@ -55,6 +57,11 @@ def upload_db():
     except Exception as e:
         print(f"⚠️ Failed to upload to GCS: {e}")
 
+def use_rollback_journal():
+    """Leave the WAL mode migrate() sets, so commits land in the file upload_db() sends"""
+    with closing(sqlite3.connect(DB_PATH)) as conn:
+        conn.execute("PRAGMA journal_mode = DELETE")
+
 # Connect to SQLite Database
 def connect_db():
     """Connect to the SQLite database"""
@@ -63,97 +70,9 @@ def connect_db():
 # Initialize database
 download_db()
 
-# Initialize tables
-def create_table():
-    with connect_db() as conn:
-        cursor = conn.cursor()
-        
-        # Create quizzes table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS quizzes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                category TEXT NOT NULL
-            )
-        ''')
-
-        # Create questions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS questions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                quiz_id INTEGER,
-                class_level TEXT,
-                subject TEXT,
-                book_name TEXT,
-                chapter TEXT,
-                question TEXT NOT NULL,
-                option1 TEXT NOT NULL,
-                option2 TEXT NOT NULL,
-                option3 TEXT NOT NULL,
-                option4 TEXT NOT NULL,
-                correct_answer TEXT NOT NULL,
-                FOREIGN KEY (quiz_id) REFERENCES quizzes(id)
-            )
-        ''')
-
-        # Create game_sessions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS game_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                quiz_id INTEGER NOT NULL,
-                pin INTEGER NOT NULL,
-                status TEXT DEFAULT "active",
-                current_question_index INTEGER DEFAULT 0,
-                started_for_all INTEGER DEFAULT 0,
-                FOREIGN KEY (quiz_id) REFERENCES quizzes(id)
-            )
-        ''')
-
-        # Create participants table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS participants (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                player_name TEXT NOT NULL,
-                phone_number TEXT NOT NULL,
-                email_id TEXT NOT NULL,
-                district TEXT NOT NULL,
-                game_pin INTEGER NOT NULL
-            )
-        ''')
-
-        # Create responses table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS responses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                game_pin INTEGER NOT NULL,
-                question_id INTEGER NOT NULL,
-                participant TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                is_correct INTEGER NOT NULL,
-                FOREIGN KEY (question_id) REFERENCES questions(id)
-            )
-        ''')
-
-        # Create new_questions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS new_questions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                class_level TEXT NOT NULL,
-                subject TEXT NOT NULL,
-                book_name TEXT NOT NULL,
-                chapter TEXT NOT NULL,
-                question TEXT NOT NULL,
-                option1 TEXT NOT NULL,
-                option2 TEXT NOT NULL,
-                option3 TEXT NOT NULL,
-                option4 TEXT NOT NULL,
-                correct_answer TEXT NOT NULL
-            )
-        ''')
-            
-        conn.commit()
-
-create_table()
+# Apply any pending schema migrations (shared with app.py)
+migrate(DB_PATH)
+use_rollback_journal()
 
 # Dictionary to store waiting participants
 waiting_participants = {}  # Dict of game_pin -> list of participants
@@ -343,14 +262,6 @@ def join_quiz():
         if not game:
             return jsonify({"error": "Invalid or inactive game PIN!"}), 400
 
-        # Check if the started_for_all column exists in game_sessions table
-        try:
-            cursor.execute("SELECT started_for_all FROM game_sessions WHERE pin = ?", (game_pin,))
-        except sqlite3.OperationalError:
-            # Column doesn't exist, add it
-            cursor.execute("ALTER TABLE game_sessions ADD COLUMN started_for_all INTEGER DEFAULT 0")
-            conn.commit()
-
         # Check if the quiz has already started for all
         cursor.execute("SELECT started_for_all FROM game_sessions WHERE pin = ?", (game_pin,))
         started = cursor.fetchone()[0]
@@ -1066,28 +977,6 @@ def start_quiz():
     with connect_db() as conn:
         cursor = conn.cursor()
         
-        # Ensure tables exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS game_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                quiz_id INTEGER NOT NULL,
-                pin INTEGER NOT NULL,
-                status TEXT DEFAULT "active",
-                FOREIGN KEY (quiz_id) REFERENCES quizzes(id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS responses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                game_pin INTEGER NOT NULL,
-                question_id INTEGER NOT NULL,
-                participant TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                is_correct INTEGER NOT NULL
-            )
-        ''')
-        conn.commit()
-
         # 🛑 **Fix: Insert the new game session into `game_sessions`**
         cursor.execute('''
             INSERT INTO game_sessions (quiz_id, pin, status) VALUES (?, ?, 'active')
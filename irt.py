@@ -0,0 +1,195 @@
+from datetime import datetime
+
+import click
+import numpy as np
+
+from db import pooled_connection
+
+MODELS = ("rasch", "2pl")
+
+# Priors for questions seen for the first time: difficulty ~ N(0, 2^2),
+# log discrimination ~ N(0, 0.5^2)
+DIFFICULTY_PRIOR_PRECISION = 0.25
+LOG_DISCRIMINATION_PRIOR_PRECISION = 4.0
+
+# Ability distribution N(0, 1) is integrated over this many grid points
+QUADRATURE_POINTS = 21
+MAX_ITERATIONS = 500
+# Newton steps on the item parameters per EM iteration
+M_STEPS = 3
+TOLERANCE = 1e-4
+
+
+def fit(person, item, correct, n_persons, n_items, difficulty_mean, difficulty_precision,
+        log_discrimination_mean, log_discrimination_precision, model="2pl"):
+    """Fit a Rasch or 2PL model to a sparse list of responses.
+
+    Marginal maximum likelihood by EM (Bock-Aitkin): abilities are
+    integrated out over a quadrature grid under an N(0, 1) population, which
+    also fixes the scale of the parameters. person, item and correct are
+    parallel arrays, one entry per response. Every item has a Gaussian prior
+    on its difficulty and log discrimination (the previous calibration's
+    estimate and precision when warm-starting). Both steps are vectorized:
+    responses x grid arrays reduced with np.bincount, then Newton steps on
+    items x grid expected counts.
+
+    Returns (difficulty, discrimination, difficulty_precision,
+    discrimination_precision, iterations); the precisions are the posterior
+    ones, to be used as the prior of the next incremental run.
+    """
+    nodes = np.linspace(-4, 4, QUADRATURE_POINTS)
+    log_weights = -nodes ** 2 / 2
+    log_weights -= np.logaddexp.reduce(log_weights)
+    y = correct.astype(np.float64)
+    b = difficulty_mean.astype(np.float64).copy()
+    alpha = log_discrimination_mean.astype(np.float64).copy() if model == "2pl" else np.zeros(n_items)
+
+    # Flat (row, grid point) indices so one bincount reduces a whole responses x grid array
+    grid = np.arange(QUADRATURE_POINTS)
+    person_cells = (person[:, None] * QUADRATURE_POINTS + grid).ravel()
+    item_cells = (item[:, None] * QUADRATURE_POINTS + grid).ravel()
+
+    def per_cell(cells, values, rows):
+        return np.bincount(cells, values.ravel(), rows * QUADRATURE_POINTS).reshape(rows, QUADRATURE_POINTS)
+
+    for iteration in range(1, MAX_ITERATIONS + 1):
+        # E-step: posterior of each player's ability over the grid, from
+        # per item x grid point log-probabilities gathered for every response...
+        z = np.exp(alpha)[:, None] * (nodes - b[:, None])
+        log_wrong = -np.logaddexp(0, z)
+        log_ratio = z  # log p - log(1 - p)
+        log_likelihood = log_wrong[item] + y[:, None] * log_ratio[item]
+        posterior = per_cell(person_cells, log_likelihood, n_persons) + log_weights
+        posterior = np.exp(posterior - posterior.max(axis=1, keepdims=True))
+        posterior /= posterior.sum(axis=1, keepdims=True)
+
+        # ...spread over each item's responses as expected counts per grid point
+        weights = posterior[person]
+        attempts = per_cell(item_cells, weights, n_items)
+        right = per_cell(item_cells, weights * y[:, None], n_items)
+
+        # M-step: Newton on each item's (difficulty, log discrimination)
+        previous_b, previous_alpha = b.copy(), alpha.copy()
+        for _ in range(M_STEPS):
+            b, alpha, b_info, alpha_info = _item_step(
+                nodes, attempts, right, b, alpha, difficulty_mean, difficulty_precision,
+                log_discrimination_mean, log_discrimination_precision, model
+            )
+
+        change = max(np.abs(b - previous_b).max(initial=0), np.abs(alpha - previous_alpha).max(initial=0))
+        if change < TOLERANCE:
+            break
+
+    return b, np.exp(alpha), b_info, alpha_info, iteration
+
+
+def _item_step(nodes, attempts, right, b, alpha, difficulty_mean, difficulty_precision,
+               log_discrimination_mean, log_discrimination_precision, model):
+    """One diagonal Newton step on every item; returns the new parameters and
+    the posterior precisions (information plus prior) at the old ones"""
+    a = np.exp(alpha)[:, None]
+    z = a * (nodes - b[:, None])
+    p = 1 / (1 + np.exp(-z))
+    residual = right - attempts * p
+    w = attempts * p * (1 - p)
+
+    b_grad = -(a * residual).sum(axis=1) - difficulty_precision * (b - difficulty_mean)
+    b_info = (a * a * w).sum(axis=1) + difficulty_precision
+    b = b + np.clip(b_grad / b_info, -1, 1)
+
+    if model != "2pl":
+        return b, alpha, b_info, np.zeros_like(alpha)
+    # d z / d log a = z
+    alpha_grad = (residual * z).sum(axis=1) - log_discrimination_precision * (alpha - log_discrimination_mean)
+    alpha_info = (w * z * z).sum(axis=1) + log_discrimination_precision
+    alpha = np.clip(alpha + np.clip(alpha_grad / alpha_info, -0.5, 0.5), -2, 2)
+    return b, alpha, b_info, alpha_info
+
+
+def calibrate(conn, model="2pl", full=False):
+    """Calibrate question parameters and store them in question_irt.
+
+    Incremental by default: only responses added since the last run are
+    read, and each question's stored estimate and precision act as its
+    prior, so a nightly run costs the size of that day's games. full=True
+    recalibrates from every response with fresh priors. The caller commits.
+    Returns (questions updated, responses used).
+    """
+    state = f"irt_{model}"  # Each model keeps its own watermark
+    watermark = conn.execute("SELECT last_response_id FROM rollup_state WHERE name = ?", (state,)).fetchone()
+    last_id = 0 if full or not watermark else watermark[0]
+    newest_id = conn.execute("SELECT MAX(id) FROM responses").fetchone()[0] or 0
+
+    rows = conn.execute(
+        "SELECT game_pin, participant, question_id, is_correct FROM responses WHERE id > ? AND id <= ?",
+        (last_id, newest_id)
+    ).fetchall()
+    if rows:
+        game_pins, participants, question_ids, correct = zip(*rows)
+        _, person = np.unique(
+            np.array([f"{pin}\x00{name}" for pin, name in zip(game_pins, participants)]), return_inverse=True
+        )
+        items, item = np.unique(np.array(question_ids, dtype=np.int64), return_inverse=True)
+        n_items = len(items)
+
+        difficulty_mean = np.zeros(n_items)
+        difficulty_precision = np.full(n_items, DIFFICULTY_PRIOR_PRECISION)
+        log_discrimination_mean = np.zeros(n_items)
+        log_discrimination_precision = np.full(n_items, LOG_DISCRIMINATION_PRIOR_PRECISION)
+        responses = np.zeros(n_items, dtype=np.int64)
+        if not full:
+            # Warm start: the previous posterior becomes this run's prior
+            position = {int(question_id): i for i, question_id in enumerate(items)}
+            stored = conn.execute(
+                "SELECT question_id, difficulty, discrimination, difficulty_precision, "
+                "discrimination_precision, responses FROM question_irt WHERE model = ?", (model,)
+            )
+            for question_id, b, a, b_precision, a_precision, count in stored:
+                i = position.get(question_id)
+                if i is None:
+                    continue
+                difficulty_mean[i], difficulty_precision[i] = b, b_precision
+                if model == "2pl":
+                    log_discrimination_mean[i], log_discrimination_precision[i] = np.log(a), a_precision
+                responses[i] = count
+
+        b, a, b_precision, a_precision, _ = fit(
+            person, item, np.array(correct), person.max() + 1, n_items,
+            difficulty_mean, difficulty_precision, log_discrimination_mean, log_discrimination_precision, model
+        )
+        responses += np.bincount(item, minlength=n_items)
+
+        if full:
+            conn.execute("DELETE FROM question_irt WHERE model = ?", (model,))
+        updated_at = datetime.now().isoformat(timespec="seconds")
+        conn.executemany('''
+            INSERT OR REPLACE INTO question_irt (
+                question_id, model, difficulty, discrimination,
+                difficulty_precision, discrimination_precision, responses, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (int(items[i]), model, float(b[i]), float(a[i]), float(b_precision[i]),
+             float(a_precision[i]), int(responses[i]), updated_at)
+            for i in range(n_items)
+        ])
+
+    conn.execute('''
+        INSERT INTO rollup_state (name, last_response_id) VALUES (?, ?)
+        ON CONFLICT (name) DO UPDATE SET last_response_id = excluded.last_response_id
+    ''', (state, newest_id))
+    return (len(items) if rows else 0), len(rows)
+
+
+@click.command("calibrate-irt")
+@click.option("--model", type=click.Choice(MODELS), default="2pl", show_default=True)
+@click.option("--full", is_flag=True, help="Recalibrate from every response instead of only new ones.")
+def calibrate_irt_command(model, full):
+    """Fit item response parameters (difficulty, discrimination) per question."""
+    with pooled_connection() as conn:
+        with conn:
+            questions, responses = calibrate(conn, model, full)
+    click.echo(f"✅ Calibrated {questions} questions from {responses} new responses")
+
+
+def init_app(app):
+    app.cli.add_command(calibrate_irt_command)
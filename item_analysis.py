@@ -0,0 +1,153 @@
+from datetime import datetime
+
+import click
+import numpy as np
+
+from db import pooled_connection
+
+# Share of participants in each of the upper and lower groups of the
+# discrimination index (Kelley's 27%)
+DISCRIMINATION_GROUP = 0.27
+
+
+def load_matrix(conn, game_pin=None, quiz_id=None):
+    """Participant x question 0/1 matrix of a game's or a quiz's responses.
+
+    Returns (matrix, question_ids). Rows are participants (per game, so the
+    same name in two games is two rows); an unanswered question counts as
+    wrong and a question answered twice counts as right if either answer was.
+    """
+    if game_pin is not None:
+        rows = conn.execute(
+            "SELECT game_pin, participant, question_id, is_correct FROM responses WHERE game_pin = ?",
+            (game_pin,)
+        ).fetchall()
+    else:
+        rows = conn.execute('''
+            SELECT r.game_pin, r.participant, r.question_id, r.is_correct
+            FROM game_sessions g JOIN responses r ON r.game_pin = g.pin
+            WHERE g.quiz_id = ?
+        ''', (quiz_id,)).fetchall()
+    if not rows:
+        return np.zeros((0, 0), dtype=np.int8), np.zeros(0, dtype=np.int64)
+
+    game_pins, participants, question_ids, correct = zip(*rows)
+    _, row_index = np.unique(
+        np.array([f"{pin}\x00{name}" for pin, name in zip(game_pins, participants)]), return_inverse=True
+    )
+    columns, column_index = np.unique(np.array(question_ids, dtype=np.int64), return_inverse=True)
+
+    matrix = np.zeros((row_index.max() + 1, len(columns)), dtype=np.int8)
+    np.maximum.at(matrix, (row_index, column_index), np.array(correct, dtype=np.int8))
+    return matrix, columns
+
+
+def _optional(value, digits=4):
+    return None if value is None or not np.isfinite(value) else round(float(value), digits)
+
+
+def analyze(matrix):
+    """Classical test theory statistics of a 0/1 participant x item matrix.
+
+    Returns a dict with, per item (column): p_value (share correct),
+    discrimination (upper minus lower 27% group p-value) and point_biserial
+    (correlation with the rest score, i.e. the total without that item);
+    plus cronbach_alpha for the whole form.
+    """
+    n, k = matrix.shape
+    x = matrix.astype(np.float64)
+    totals = x.sum(axis=1)
+
+    p_values = x.mean(axis=0) if n else np.full(k, np.nan)
+
+    # Discrimination index: upper vs lower group by total score
+    group = max(int(round(n * DISCRIMINATION_GROUP)), 1)
+    if n >= 2:
+        order = np.argsort(totals, kind="stable")
+        discrimination = x[order[-group:]].mean(axis=0) - x[order[:group]].mean(axis=0)
+    else:
+        discrimination = np.full(k, np.nan)
+
+    # Corrected point-biserial: Pearson r of each item with the rest score
+    rest = totals[:, None] - x
+    x_dev = x - x.mean(axis=0) if n else x
+    rest_dev = rest - rest.mean(axis=0) if n else rest
+    with np.errstate(invalid="ignore", divide="ignore"):
+        point_biserial = (x_dev * rest_dev).sum(axis=0) / np.sqrt(
+            (x_dev ** 2).sum(axis=0) * (rest_dev ** 2).sum(axis=0)
+        )
+
+    # Cronbach's alpha: k/(k-1) * (1 - sum of item variances / total variance)
+    alpha = None
+    if n >= 2 and k >= 2:
+        total_variance = totals.var(ddof=1)
+        if total_variance > 0:
+            alpha = k / (k - 1) * (1 - x.var(axis=0, ddof=1).sum() / total_variance)
+
+    return {
+        "participants": n,
+        "cronbach_alpha": _optional(alpha),
+        "p_value": p_values,
+        "discrimination": discrimination,
+        "point_biserial": point_biserial,
+    }
+
+
+def item_report(matrix, question_ids):
+    """analyze() as JSON-ready data, one entry per question"""
+    stats = analyze(matrix)
+    return {
+        "participants": stats["participants"],
+        "cronbach_alpha": stats["cronbach_alpha"],
+        "items": [
+            {
+                "question_id": int(question_id),
+                "p_value": _optional(stats["p_value"][i]),
+                "discrimination": _optional(stats["discrimination"][i]),
+                "point_biserial": _optional(stats["point_biserial"][i]),
+            }
+            for i, question_id in enumerate(question_ids)
+        ],
+    }
+
+
+def store_quiz_analysis(conn, quiz_id):
+    """Recompute and save the item statistics of one quiz; returns the report"""
+    matrix, question_ids = load_matrix(conn, quiz_id=quiz_id)
+    report = item_report(matrix, question_ids)
+    updated_at = datetime.now().isoformat(timespec="seconds")
+    conn.executemany('''
+        INSERT OR REPLACE INTO item_statistics
+            (question_id, quiz_id, p_value, discrimination, point_biserial, participants, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (item["question_id"], quiz_id, item["p_value"], item["discrimination"],
+         item["point_biserial"], report["participants"], updated_at)
+        for item in report["items"]
+    ])
+    conn.execute('''
+        INSERT OR REPLACE INTO quiz_reliability (quiz_id, cronbach_alpha, participants, items, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (quiz_id, report["cronbach_alpha"], report["participants"], len(report["items"]), updated_at))
+    return report
+
+
+@click.command("analyze-items")
+@click.option("--quiz-id", type=int, multiple=True, help="Only these quizzes (default: every played quiz).")
+def analyze_items_command(quiz_id):
+    """Recompute item difficulty, discrimination and reliability per quiz."""
+    with pooled_connection() as conn:
+        quiz_ids = quiz_id or [row[0] for row in conn.execute(
+            "SELECT DISTINCT quiz_id FROM game_sessions ORDER BY quiz_id"
+        )]
+        for quiz in quiz_ids:
+            with conn:
+                report = store_quiz_analysis(conn, quiz)
+            click.echo(
+                f"✅ Quiz {quiz}: {len(report['items'])} items, {report['participants']} participants, "
+                f"alpha={report['cronbach_alpha']}"
+            )
+
+
+def init_app(app):
+    app.cli.add_command(analyze_items_command)
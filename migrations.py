@@ -0,0 +1,537 @@
+import sqlite3
+from datetime import datetime
+
+from db import open_connection
+from dedup import SOURCES as DEDUP_SOURCES
+
+# Ordered schema migrations. Each entry is (version, description, function);
+# append new ones at the end and never edit one that has already shipped.
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return register
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+@migration(1, "baseline schema")
+def create_base_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS quizzes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            category TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            quiz_id INTEGER,  -- Optional, can be NULL
+            class_level TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            book_name TEXT NOT NULL,
+            chapter TEXT NOT NULL,
+            question TEXT NOT NULL,
+            option1 TEXT NOT NULL,
+            option2 TEXT NOT NULL,
+            option3 TEXT NOT NULL,
+            option4 TEXT NOT NULL,
+            correct_answer TEXT NOT NULL,
+            FOREIGN KEY (quiz_id) REFERENCES quizzes(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS game_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            quiz_id INTEGER NOT NULL,
+            pin INTEGER NOT NULL,
+            status TEXT DEFAULT "active",
+            current_question_index INTEGER DEFAULT 0,
+            started_for_all INTEGER DEFAULT 0,
+            FOREIGN KEY (quiz_id) REFERENCES quizzes(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS participants (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            player_name TEXT NOT NULL,
+            phone_number TEXT NOT NULL,
+            email_id TEXT NOT NULL,
+            district TEXT NOT NULL,
+            game_pin INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            game_pin INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            participant TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            is_correct INTEGER NOT NULL,
+            FOREIGN KEY (question_id) REFERENCES questions(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS new_questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            class_level TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            book_name TEXT NOT NULL,
+            chapter TEXT NOT NULL,
+            question TEXT NOT NULL,
+            option1 TEXT NOT NULL,
+            option2 TEXT NOT NULL,
+            option3 TEXT NOT NULL,
+            option4 TEXT NOT NULL,
+            correct_answer TEXT NOT NULL
+        )
+    ''')
+
+    # Databases created by older versions of the app lack these columns
+    game_columns = _columns(conn, "game_sessions")
+    if "current_question_index" not in game_columns:
+        conn.execute("ALTER TABLE game_sessions ADD COLUMN current_question_index INTEGER DEFAULT 0")
+    if "started_for_all" not in game_columns:
+        conn.execute("ALTER TABLE game_sessions ADD COLUMN started_for_all INTEGER DEFAULT 0")
+
+
+@migration(2, "rebuild legacy questions table with optional quiz_id")
+def rebuild_questions_table(conn):
+    # Early databases declared quiz_id NOT NULL and appended book_name later,
+    # which breaks add_question for bank questions that have no quiz yet.
+    info = {row[1]: row for row in conn.execute("PRAGMA table_info(questions)")}
+    if "book_name" in info and not info["quiz_id"][3] and info["book_name"][3]:
+        return
+
+    conn.execute('''
+        CREATE TABLE questions_rebuilt (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            quiz_id INTEGER,  -- Optional, can be NULL
+            class_level TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            book_name TEXT NOT NULL,
+            chapter TEXT NOT NULL,
+            question TEXT NOT NULL,
+            option1 TEXT NOT NULL,
+            option2 TEXT NOT NULL,
+            option3 TEXT NOT NULL,
+            option4 TEXT NOT NULL,
+            correct_answer TEXT NOT NULL,
+            FOREIGN KEY (quiz_id) REFERENCES quizzes(id)
+        )
+    ''')
+    book_name = "COALESCE(book_name, '')" if "book_name" in info else "''"
+    conn.execute(f'''
+        INSERT INTO questions_rebuilt (
+            id, quiz_id, class_level, subject, book_name, chapter, question,
+            option1, option2, option3, option4, correct_answer
+        )
+        SELECT id, quiz_id, COALESCE(class_level, ''), COALESCE(subject, ''), {book_name},
+               COALESCE(chapter, ''), question, option1, option2, option3, option4, correct_answer
+        FROM questions
+    ''')
+    conn.execute("DROP TABLE questions")
+    conn.execute("ALTER TABLE questions_rebuilt RENAME TO questions")
+
+
+@migration(3, "secondary indexes for hot route predicates")
+def create_indexes(conn):
+    # Secondary indexes backing the hot per-game and per-quiz predicates;
+    # later indexes are added by their own migrations
+    indexes = (
+        ("idx_responses_pin_question",
+         "CREATE INDEX IF NOT EXISTS idx_responses_pin_question ON responses (game_pin, question_id)"),
+        ("idx_responses_pin_participant",
+         "CREATE INDEX IF NOT EXISTS idx_responses_pin_participant ON responses (game_pin, participant, is_correct)"),
+        ("idx_questions_quiz",
+         "CREATE INDEX IF NOT EXISTS idx_questions_quiz ON questions (quiz_id)"),
+        ("idx_questions_catalog",
+         "CREATE INDEX IF NOT EXISTS idx_questions_catalog ON questions (class_level, subject, book_name, chapter)"),
+        ("ux_game_sessions_pin",
+         "CREATE UNIQUE INDEX IF NOT EXISTS ux_game_sessions_pin ON game_sessions (pin)"),
+        ("idx_participants_pin",
+         "CREATE INDEX IF NOT EXISTS idx_participants_pin ON participants (game_pin)"),
+    )
+    for name, sql in indexes:
+        try:
+            conn.execute(sql)
+        except sqlite3.IntegrityError as e:
+            # e.g. duplicate game PINs left over from before the unique index
+            print(f"⚠️ Could not create index {name}: {e}")
+
+
+@migration(4, "game_events append log for live game state")
+def create_game_events(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS game_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            game_pin INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            payload TEXT,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_game_events_pin ON game_events (game_pin, id)")
+
+
+@migration(5, "materialized per-game and per-question answer statistics")
+def create_answer_stats(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS game_stats (
+            game_pin INTEGER PRIMARY KEY,
+            correct INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            participants INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS game_question_stats (
+            game_pin INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            correct INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            option1 INTEGER NOT NULL DEFAULT 0,  -- answers matching each option
+            option2 INTEGER NOT NULL DEFAULT 0,
+            option3 INTEGER NOT NULL DEFAULT 0,
+            option4 INTEGER NOT NULL DEFAULT 0,
+            other INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (game_pin, question_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS game_participant_stats (
+            game_pin INTEGER NOT NULL,
+            participant TEXT NOT NULL,
+            correct INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (game_pin, participant)
+        ) WITHOUT ROWID
+    ''')
+
+    # Kept in step with responses inside the inserting transaction, whichever
+    # code path writes the row (answer buffer, imports, the other app variants)
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_responses_stats AFTER INSERT ON responses
+        BEGIN
+            INSERT INTO game_stats (game_pin, correct, total, participants)
+            VALUES (
+                NEW.game_pin, NEW.is_correct, 1,
+                NOT EXISTS (
+                    SELECT 1 FROM game_participant_stats
+                    WHERE game_pin = NEW.game_pin AND participant = NEW.participant
+                )
+            )
+            ON CONFLICT (game_pin) DO UPDATE SET
+                correct = correct + excluded.correct,
+                total = total + 1,
+                participants = participants + excluded.participants;
+
+            INSERT INTO game_participant_stats (game_pin, participant, correct, total)
+            VALUES (NEW.game_pin, NEW.participant, NEW.is_correct, 1)
+            ON CONFLICT (game_pin, participant) DO UPDATE SET
+                correct = correct + excluded.correct,
+                total = total + 1;
+
+            INSERT INTO game_question_stats (
+                game_pin, question_id, correct, total, option1, option2, option3, option4, other
+            )
+            SELECT NEW.game_pin, NEW.question_id, NEW.is_correct, 1,
+                   pick = 1, pick = 2, pick = 3, pick = 4, pick = 0
+            FROM (
+                SELECT CASE NEW.answer
+                           WHEN q.option1 THEN 1 WHEN q.option2 THEN 2
+                           WHEN q.option3 THEN 3 WHEN q.option4 THEN 4 ELSE 0
+                       END AS pick
+                FROM (SELECT NEW.question_id AS id) AS a
+                LEFT JOIN questions q ON q.id = a.id
+            )
+            WHERE true
+            ON CONFLICT (game_pin, question_id) DO UPDATE SET
+                correct = correct + excluded.correct,
+                total = total + 1,
+                option1 = option1 + excluded.option1,
+                option2 = option2 + excluded.option2,
+                option3 = option3 + excluded.option3,
+                option4 = option4 + excluded.option4,
+                other = other + excluded.other;
+        END
+    ''')
+
+    # Backfill from the responses recorded so far
+    conn.execute('''
+        INSERT OR REPLACE INTO game_participant_stats (game_pin, participant, correct, total)
+        SELECT game_pin, participant, SUM(is_correct), COUNT(*)
+        FROM responses GROUP BY game_pin, participant
+    ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO game_stats (game_pin, correct, total, participants)
+        SELECT game_pin, SUM(correct), SUM(total), COUNT(*)
+        FROM game_participant_stats GROUP BY game_pin
+    ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO game_question_stats (
+            game_pin, question_id, correct, total, option1, option2, option3, option4, other
+        )
+        SELECT game_pin, question_id, SUM(is_correct), COUNT(*),
+               SUM(pick = 1), SUM(pick = 2), SUM(pick = 3), SUM(pick = 4), SUM(pick = 0)
+        FROM (
+            SELECT r.game_pin, r.question_id, r.is_correct,
+                   CASE r.answer
+                       WHEN q.option1 THEN 1 WHEN q.option2 THEN 2
+                       WHEN q.option3 THEN 3 WHEN q.option4 THEN 4 ELSE 0
+                   END AS pick
+            FROM responses r LEFT JOIN questions q ON q.id = r.question_id
+        )
+        GROUP BY game_pin, question_id
+    ''')
+
+
+@migration(6, "responses index for since_id cursors")
+def index_responses_by_id(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_pin_id ON responses (game_pin, id)")
+
+
+@migration(7, "district x quiz x day rollup of answer statistics")
+def create_district_rollup(conn):
+    if "created_at" not in _columns(conn, "game_sessions"):
+        conn.execute("ALTER TABLE game_sessions ADD COLUMN created_at TEXT")
+    # Games started since the event log was added know when they began
+    conn.execute('''
+        UPDATE game_sessions SET created_at = (
+            SELECT MIN(created_at) FROM game_events WHERE game_events.game_pin = game_sessions.pin
+        )
+        WHERE created_at IS NULL
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS district_game_stats (
+            game_pin INTEGER NOT NULL,
+            district TEXT NOT NULL,
+            quiz_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            participants INTEGER NOT NULL,
+            attempts INTEGER NOT NULL,
+            correct INTEGER NOT NULL,
+            passed INTEGER NOT NULL,
+            PRIMARY KEY (game_pin, district)
+        ) WITHOUT ROWID
+    ''')
+    # Cells are re-summed from the games that touch them
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_district_game_stats_cell ON district_game_stats (district, quiz_id, day)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS district_stats (
+            district TEXT NOT NULL,
+            quiz_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            games INTEGER NOT NULL,
+            participants INTEGER NOT NULL,
+            attempts INTEGER NOT NULL,
+            correct INTEGER NOT NULL,
+            passed INTEGER NOT NULL,
+            PRIMARY KEY (district, quiz_id, day)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_district_stats_quiz ON district_stats (quiz_id, day)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_district_stats_day ON district_stats (day)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            last_response_id INTEGER NOT NULL
+        )
+    ''')
+    # Filled from the existing responses by the rollup catch-up in app.py
+
+
+@migration(8, "classical item statistics per question and reliability per quiz")
+def create_item_statistics(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_game_sessions_quiz ON game_sessions (quiz_id)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS item_statistics (
+            question_id INTEGER PRIMARY KEY,
+            quiz_id INTEGER,
+            p_value REAL,
+            discrimination REAL,
+            point_biserial REAL,
+            participants INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS quiz_reliability (
+            quiz_id INTEGER PRIMARY KEY,
+            cronbach_alpha REAL,
+            participants INTEGER NOT NULL,
+            items INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+
+
+@migration(9, "item response theory parameters per question")
+def create_question_irt(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_irt (
+            question_id INTEGER NOT NULL,
+            model TEXT NOT NULL,  -- 'rasch' or '2pl'
+            difficulty REAL NOT NULL,
+            discrimination REAL NOT NULL,
+            difficulty_precision REAL NOT NULL,  -- posterior precision, the next run's prior
+            discrimination_precision REAL NOT NULL,
+            responses INTEGER NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (question_id, model)
+        ) WITHOUT ROWID
+    ''')
+
+
+# Question banks indexed for /search_questions
+SEARCH_TABLES = ("questions", "new_questions")
+
+
+@migration(10, "FTS5 full-text index over question banks")
+def create_question_search(conn):
+    for table in SEARCH_TABLES:
+        fts = f"{table}_fts"
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                question, option1, option2, option3, option4,
+                content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        ''')
+        # External-content index: the triggers keep it in step with the table
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, question, option1, option2, option3, option4)
+                VALUES (NEW.id, NEW.question, NEW.option1, NEW.option2, NEW.option3, NEW.option4);
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, question, option1, option2, option3, option4)
+                VALUES ('delete', OLD.id, OLD.question, OLD.option1, OLD.option2, OLD.option3, OLD.option4);
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_update
+            AFTER UPDATE OF question, option1, option2, option3, option4 ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, question, option1, option2, option3, option4)
+                VALUES ('delete', OLD.id, OLD.question, OLD.option1, OLD.option2, OLD.option3, OLD.option4);
+                INSERT INTO {fts} (rowid, question, option1, option2, option3, option4)
+                VALUES (NEW.id, NEW.question, NEW.option1, NEW.option2, NEW.option3, NEW.option4);
+            END
+        ''')
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+@migration(11, "near-duplicate question index")
+def create_question_signatures(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_signatures (
+            source TEXT NOT NULL,
+            question_id INTEGER NOT NULL,
+            signature BLOB NOT NULL,
+            cluster_source TEXT,
+            cluster_id INTEGER,
+            PRIMARY KEY (source, question_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_lsh (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            question_id INTEGER NOT NULL,
+            PRIMARY KEY (band, bucket, source, question_id)
+        ) WITHOUT ROWID
+    ''')
+    for table in DEDUP_SOURCES:
+        # Signatures are computed in Python; deleted or edited questions just
+        # drop out of the index until index_missing() picks the edited ones
+        # up again. Their buckets stay behind, which is harmless since
+        # lookups go through question_signatures, and saves an index
+        for event in ("DELETE", "UPDATE OF question, option1, option2, option3, option4"):
+            name = f"trg_{table}_signature_{event.split()[0].lower()}"
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} BEGIN
+                    DELETE FROM question_signatures WHERE source = '{table}' AND question_id = OLD.id;
+                END
+            ''')
+    # Existing questions are indexed by the catch-up in app.py
+
+
+@migration(12, "version counter invalidating the in-process question catalog")
+def create_cache_versions(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('catalog', 1)")
+    bump = "UPDATE cache_versions SET version = version + 1 WHERE name = 'catalog';"
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_questions_catalog_insert AFTER INSERT ON questions BEGIN {bump} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_questions_catalog_delete AFTER DELETE ON questions BEGIN {bump} END")
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_questions_catalog_update
+        AFTER UPDATE OF class_level, subject, book_name, chapter ON questions BEGIN {bump} END
+    ''')
+
+
+def current_version(conn):
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(path=None):
+    """Bring the database up to the latest schema version.
+
+    Runs once at process start. Migrations are applied in order, each in its
+    own transaction, and recorded in schema_version so restarts are a no-op.
+    """
+    conn = open_connection(path)
+    conn.isolation_level = None  # explicit transaction control below
+    # Table rebuilds must not trip foreign keys midway; checked afterwards
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            )
+        ''')
+        applied = 0
+        for version, description, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version <= current_version(conn):
+                continue
+            # IMMEDIATE takes the write lock so concurrent workers migrate once
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if version <= current_version(conn):
+                    conn.execute("ROLLBACK")
+                    continue
+                func(conn)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now().isoformat(timespec="seconds"))
+                )
+                conn.execute("COMMIT")
+                applied += 1
+                print(f"✅ Applied migration {version}: {description}")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        problems = conn.execute("PRAGMA foreign_key_check").fetchall() if applied else []
+        if problems:
+            print(f"⚠️ {len(problems)} rows violate foreign keys after migration")
+    finally:
+        conn.close()
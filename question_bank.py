@@ -0,0 +1,258 @@
+import csv
+import io
+import json
+import sys
+
+import click
+
+from db import pooled_connection
+from dedup import add_signatures
+
+# Columns every imported question needs, in insert order
+QUESTION_FIELDS = (
+    "class_level", "subject", "book_name", "chapter", "question",
+    "option1", "option2", "option3", "option4", "correct_answer",
+)
+
+# Tables questions can be imported into; only questions has a quiz_id
+IMPORT_TABLES = ("questions", "new_questions")
+FORMATS = ("csv", "jsonl")
+
+# Rows inserted per transaction, so memory and lock time stay bounded
+IMPORT_CHUNK = 5000
+MAX_REPORTED_ERRORS = 100
+
+# Rows fetched and written per piece of an export
+EXPORT_CHUNK = 1000
+EXPORT_FILTERS = ("class_level", "subject", "book_name", "chapter")
+CONTENT_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def detect_format(filename, default=None):
+    """csv or jsonl from a file name's extension (.ndjson counts as jsonl)"""
+    extension = (filename or "").rsplit(".", 1)[-1].lower()
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    return "csv" if extension == "csv" else default
+
+
+def read_records(stream, fmt):
+    """Yield (line number, record dict or None, parse error or None) from a text stream"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        missing = [field for field in QUESTION_FIELDS if field not in (reader.fieldnames or ())]
+        if missing:
+            raise ValueError(f"CSV header is missing: {', '.join(missing)}")
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, None, f"Invalid JSON: {e.msg}"
+            continue
+        if isinstance(record, dict):
+            yield line_number, record, None
+        else:
+            yield line_number, None, "Each line must be a JSON object"
+
+
+def _text(value):
+    if value is None or isinstance(value, (bool, dict, list)):
+        return None
+    return str(value).strip() or None
+
+
+def validate(record, table, quiz_ids):
+    """The insert parameters of one record, or raise ValueError with what is wrong"""
+    values = [_text(record.get(field)) for field in QUESTION_FIELDS]
+    missing = [field for field, value in zip(QUESTION_FIELDS, values) if value is None]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+    options = values[5:9]
+    if values[9] not in options:
+        raise ValueError("correct_answer must be one of the options")
+    if table != "questions":
+        return values
+
+    quiz_id = _text(record.get("quiz_id"))
+    if quiz_id is not None:
+        try:
+            quiz_id = int(quiz_id)
+        except ValueError:
+            raise ValueError("quiz_id must be an integer")
+        if quiz_id not in quiz_ids:
+            raise ValueError(f"Quiz {quiz_id} does not exist")
+    return [quiz_id] + values
+
+
+def import_questions(conn, stream, fmt, table="questions", chunk_size=IMPORT_CHUNK):
+    """Validate and insert questions read from a CSV or JSONL text stream.
+
+    Records are read lazily and inserted chunk_size rows per transaction,
+    and indexed for near-duplicate detection in the same transaction.
+    Invalid records are skipped and reported; the valid ones are imported
+    regardless. Raises ValueError for an unknown table or format or a CSV
+    without the required columns. Returns {"imported", "rejected",
+    "errors"}, errors being the first MAX_REPORTED_ERRORS {"line", "error"}.
+    """
+    if table not in IMPORT_TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+
+    columns = (("quiz_id",) if table == "questions" else ()) + QUESTION_FIELDS
+    column_list = ", ".join(columns)
+    # Rows are staged in a temp table and copied over in one statement, so
+    # the full-text triggers index a chunk in one go instead of per row
+    staging = f"temp.import_{table}"
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS import_{table} ({column_list})")
+    quiz_ids = {quiz_id for (quiz_id,) in conn.execute("SELECT id FROM quizzes")} if table == "questions" else set()
+    question_index = columns.index("question")
+
+    imported, rejected, errors = 0, 0, []
+
+    def insert(chunk):
+        with conn:
+            conn.execute(f"DELETE FROM {staging}")
+            conn.executemany(f"INSERT INTO {staging} VALUES ({', '.join('?' * len(columns))})", chunk)
+            conn.execute(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} ORDER BY rowid")
+            # The write lock is held for the whole transaction, so the chunk got consecutive ids
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            add_signatures(conn, table, [
+                (last_id - len(chunk) + 1 + i, row[question_index], row[question_index + 1:question_index + 5])
+                for i, row in enumerate(chunk)
+            ])
+
+    chunk = []
+    for line_number, record, error in read_records(stream, fmt):
+        if error is None:
+            try:
+                chunk.append(validate(record, table, quiz_ids))
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            rejected += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"line": line_number, "error": error})
+            continue
+        if len(chunk) >= chunk_size:
+            insert(chunk)
+            imported += len(chunk)
+            chunk = []
+    if chunk:
+        insert(chunk)
+        imported += len(chunk)
+
+    return {"imported": imported, "rejected": rejected, "errors": errors}
+
+
+def export_query(table="questions", filters=None, quiz_id=None):
+    """(columns, sql, params) selecting a table's questions for export.
+
+    filters maps EXPORT_FILTERS columns to the values to keep; quiz_id only
+    applies to questions. Raises ValueError for an unknown table or filter.
+    """
+    if table not in IMPORT_TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    unknown = set(filters or ()) - set(EXPORT_FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown filter: {', '.join(sorted(unknown))}")
+    if quiz_id is not None and table != "questions":
+        raise ValueError("quiz_id only applies to questions")
+
+    columns = ("id",) + (("quiz_id",) if table == "questions" else ()) + QUESTION_FIELDS
+    conditions = [f"{column} = ?" for column in (filters or {})]
+    params = list((filters or {}).values())
+    if quiz_id is not None:
+        conditions.append("quiz_id = ?")
+        params.append(quiz_id)
+    sql = (f"SELECT {', '.join(columns)} FROM {table}"
+           + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+           + " ORDER BY id")
+    return columns, sql, params
+
+
+def export_questions(conn, fmt, query):
+    """Yield the rows of an export_query() as CSV or JSONL text, EXPORT_CHUNK rows at a time.
+
+    The cursor is read as the pieces are consumed, so nothing is
+    materialized and the first piece is ready as soon as its rows are. The
+    output is accepted by import_questions().
+    """
+    columns, sql, params = query
+    cursor = conn.execute(sql, params)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(columns)
+    while True:
+        if fmt == "csv":
+            piece = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            if piece:
+                yield piece
+        rows = cursor.fetchmany(EXPORT_CHUNK)
+        if not rows:
+            break
+        if fmt == "jsonl":
+            yield "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+        else:
+            writer.writerows(rows)
+
+
+@click.command("import-questions")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--table", type=click.Choice(IMPORT_TABLES), default="questions", show_default=True)
+@click.option("--format", "fmt", type=click.Choice(FORMATS), help="Default: from the file extension.")
+@click.option("--chunk-size", type=int, default=IMPORT_CHUNK, show_default=True, help="Rows per transaction.")
+def import_questions_command(path, table, fmt, chunk_size):
+    """Bulk load questions from a CSV or JSONL file."""
+    fmt = fmt or detect_format(path)
+    if fmt is None:
+        raise click.UsageError("Cannot tell the format from the file name; pass --format")
+    with pooled_connection() as conn, open(path, encoding="utf-8-sig", newline="") as stream:
+        try:
+            result = import_questions(conn, stream, fmt, table, chunk_size)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    for error in result["errors"]:
+        click.echo(f"❌ Line {error['line']}: {error['error']}")
+    click.echo(f"✅ Imported {result['imported']} questions into {table}, rejected {result['rejected']}")
+
+
+@click.command("export-questions")
+@click.option("--table", type=click.Choice(IMPORT_TABLES), default="questions", show_default=True)
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default="csv", show_default=True)
+@click.option("--class-level")
+@click.option("--subject")
+@click.option("--book-name")
+@click.option("--chapter")
+@click.option("--quiz-id", type=int)
+@click.option("--output", type=click.Path(dir_okay=False), help="Default: standard output.")
+def export_questions_command(table, fmt, class_level, subject, book_name, chapter, quiz_id, output):
+    """Write questions out as CSV or JSONL."""
+    filters = {column: value for column, value in zip(EXPORT_FILTERS, (class_level, subject, book_name, chapter))
+               if value is not None}
+    try:
+        query = export_query(table, filters, quiz_id)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    with pooled_connection() as conn:
+        stream = open(output, "w", encoding="utf-8", newline="") if output else sys.stdout
+        try:
+            for piece in export_questions(conn, fmt, query):
+                stream.write(piece)
+        finally:
+            if output:
+                stream.close()
+
+
+def init_app(app):
+    app.cli.add_command(import_questions_command)
+    app.cli.add_command(export_questions_command)
@@ -0,0 +1,106 @@
+import click
+
+from db import pooled_connection
+
+# Share of a quiz's questions a participant must get right to pass
+PASSING_THRESHOLD = 0.7
+
+# Games without a known start date are grouped under this day
+UNKNOWN_DAY = "unknown"
+
+
+def refresh_district_rollup(conn, game_pins=None, full=False):
+    """Bring district_stats up to date; returns the number of games recomputed.
+
+    district_game_stats holds each game's contribution per district and
+    district_stats the district x quiz x day cube summed from it. Only games
+    with responses newer than the stored watermark are recomputed (or the
+    given game_pins, or every game with full=True), then only the cube cells
+    they touch. The caller commits.
+    """
+    watermark = conn.execute(
+        "SELECT last_response_id FROM rollup_state WHERE name = 'district'"
+    ).fetchone()
+    last_id = watermark[0] if watermark else 0
+    newest_id = conn.execute("SELECT MAX(id) FROM responses").fetchone()[0] or 0
+
+    advance = game_pins is None or full
+    if full:
+        game_pins = [pin for (pin,) in conn.execute(
+            "SELECT game_pin FROM game_stats UNION SELECT game_pin FROM district_game_stats"
+        )]
+    elif game_pins is None:
+        game_pins = [pin for (pin,) in conn.execute(
+            "SELECT DISTINCT game_pin FROM responses WHERE id > ? AND id <= ?", (last_id, newest_id)
+        )]
+    game_pins = list(dict.fromkeys(game_pins))
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS rollup_games (game_pin INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM rollup_games")
+    conn.executemany("INSERT OR IGNORE INTO rollup_games (game_pin) VALUES (?)", [(pin,) for pin in game_pins])
+
+    # Cells touched before and after, so districts that disappear are cleared too
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS rollup_cells (district TEXT, quiz_id INTEGER, day TEXT)")
+    conn.execute("DELETE FROM rollup_cells")
+    conn.execute('''
+        INSERT INTO rollup_cells
+        SELECT district, quiz_id, day FROM district_game_stats
+        WHERE game_pin IN (SELECT game_pin FROM rollup_games)
+    ''')
+    conn.execute("DELETE FROM district_game_stats WHERE game_pin IN (SELECT game_pin FROM rollup_games)")
+    conn.execute('''
+        INSERT INTO district_game_stats (game_pin, district, quiz_id, day, participants, attempts, correct, passed)
+        SELECT s.game_pin, s.district, g.quiz_id, COALESCE(date(g.created_at), ?),
+               COUNT(*), SUM(s.total), SUM(s.correct),
+               SUM(s.correct >= ? * (SELECT COUNT(*) FROM questions WHERE quiz_id = g.quiz_id))
+        FROM (
+            SELECT ps.game_pin, ps.correct, ps.total,
+                   COALESCE((
+                       SELECT district FROM participants
+                       WHERE game_pin = ps.game_pin AND player_name = ps.participant
+                       ORDER BY id LIMIT 1
+                   ), 'Unknown') AS district
+            FROM game_participant_stats ps
+            WHERE ps.game_pin IN (SELECT game_pin FROM rollup_games)
+        ) s
+        JOIN game_sessions g ON g.pin = s.game_pin
+        GROUP BY s.game_pin, s.district
+    ''', (UNKNOWN_DAY, PASSING_THRESHOLD))
+    conn.execute('''
+        INSERT INTO rollup_cells
+        SELECT district, quiz_id, day FROM district_game_stats
+        WHERE game_pin IN (SELECT game_pin FROM rollup_games)
+    ''')
+
+    conn.execute('''
+        DELETE FROM district_stats
+        WHERE (district, quiz_id, day) IN (SELECT district, quiz_id, day FROM rollup_cells)
+    ''')
+    conn.execute('''
+        INSERT INTO district_stats (district, quiz_id, day, games, participants, attempts, correct, passed)
+        SELECT district, quiz_id, day, COUNT(*), SUM(participants), SUM(attempts), SUM(correct), SUM(passed)
+        FROM district_game_stats
+        WHERE (district, quiz_id, day) IN (SELECT DISTINCT district, quiz_id, day FROM rollup_cells)
+        GROUP BY district, quiz_id, day
+    ''')
+
+    if advance:
+        conn.execute('''
+            INSERT INTO rollup_state (name, last_response_id) VALUES ('district', ?)
+            ON CONFLICT (name) DO UPDATE SET last_response_id = excluded.last_response_id
+        ''', (newest_id,))
+    return len(game_pins)
+
+
+@click.command("refresh-district-rollup")
+@click.option("--full", is_flag=True, help="Recompute every game instead of only new responses.")
+def refresh_district_rollup_command(full):
+    """Update the district x quiz x day analytics cube."""
+    with pooled_connection() as conn:
+        with conn:
+            count = refresh_district_rollup(conn, full=full)
+    click.echo(f"✅ Recomputed district rollup for {count} games")
+
+
+def init_app(app):
+    app.cli.add_command(refresh_district_rollup_command)
@@ -0,0 +1,88 @@
+"""Time /get_correct_answers against a large question bank.
+
+    python tests/bench_correct_answers.py [--questions 100000]
+
+Works on a copy of database.db grown to the given number of questions.
+Reports the whole request through the test client, and the database part
+alone: the chunked IN lookup against one SELECT per id, as before.
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = (10, 100, 1000, 10000)
+
+
+def grow_bank(path, questions):
+    conn = sqlite3.connect(path)
+    missing = questions - conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+    conn.executemany(
+        "INSERT INTO questions (class_level, subject, book_name, chapter, question, "
+        "option1, option2, option3, option4, correct_answer) VALUES ('1', 'Math', 'Bench', 'Ch', ?, 'a', 'b', 'c', 'd', 'a')",
+        ((f"Benchmark question {i}",) for i in range(max(missing, 0)))
+    )
+    conn.commit()
+    ids = [question_id for (question_id,) in conn.execute("SELECT id FROM questions")]
+    conn.close()
+    return ids
+
+
+def timed(func, repeat):
+    """Median wall time of func() in milliseconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="eduassess-bench-")
+    path = os.path.join(workdir, "database.db")
+    shutil.copy(os.path.join(ROOT, "database.db"), path)
+    os.environ["DATABASE_PATH"] = path
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)  # app.py creates its uploads directory here
+    try:
+        import app
+        ids = grow_bank(path, args.questions)
+        client = app.app.test_client()
+        conn = sqlite3.connect(path)
+
+        print(f"{len(ids)} questions, median of {args.repeat} runs")
+        print(f"{'ids':>6} {'route ms':>9} {'us/id':>6} {'IN chunks ms':>13} {'per-id ms':>10}")
+        for size in SIZES:
+            sample = random.sample(ids, size)
+
+            def route():
+                response = client.post("/get_correct_answers", json={"question_ids": sample})
+                assert response.status_code == 200
+
+            def per_id():
+                for question_id in sample:
+                    conn.execute("SELECT correct_answer FROM questions WHERE id = ?", (question_id,)).fetchone()
+
+            route_ms = timed(route, args.repeat)
+            chunked_ms = timed(lambda: app.fetch_correct_answers(conn, sample), args.repeat)
+            print(f"{size:>6} {route_ms:>9.2f} {route_ms * 1000 / size:>6.1f} "
+                  f"{chunked_ms:>13.2f} {timed(per_id, args.repeat):>10.2f}")
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Work on a copy of the shipped database; db.py reads the path at import
+_tmp = tempfile.mkdtemp(prefix="eduassess-tests-")
+os.environ["DATABASE_PATH"] = os.path.join(_tmp, "database.db")
+os.environ["ANSWER_FLUSH_INTERVAL_MS"] = "0"  # Write answers from the request
+shutil.copy(os.path.join(ROOT, "database.db"), os.environ["DATABASE_PATH"])
+
+import db  # noqa: E402
+
+
+class StatementLog:
+    """Every statement run on a connection opened through db.open_connection()"""
+
+    def __init__(self):
+        self.recording = False
+        self.statements = []  # (connection, expanded SQL)
+
+    def trace(self, conn):
+        def callback(sql):
+            if self.recording:
+                self.statements.append((conn, sql))
+        conn.set_trace_callback(callback)
+
+    def take(self):
+        statements, self.statements = self.statements, []
+        return statements
+
+
+statement_log = StatementLog()
+_open_connection = db.open_connection
+
+
+def _traced_connection(path=None):
+    conn = _open_connection(path)
+    statement_log.trace(conn)
+    return conn
+
+
+# Patched before app.py and its modules import open_connection
+db.open_connection = _traced_connection
+
+
+@pytest.fixture(scope="session")
+def app():
+    import app as application
+    application.app.config["TESTING"] = True
+    yield application
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
+
+
+@pytest.fixture
+def statements():
+    statement_log.take()
+    statement_log.recording = True
+    yield statement_log
+    statement_log.recording = False
+
+
+@pytest.fixture
+def sql():
+    """A plain connection to the test database, for setting up rows"""
+    conn = sqlite3.connect(os.environ["DATABASE_PATH"])
+    yield conn
+    conn.close()
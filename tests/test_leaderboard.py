@@ -0,0 +1,45 @@
+"""Ranks, top-K and neighbour slices of leaderboard.Leaderboard with ties."""
+from leaderboard import Leaderboard
+
+
+def board():
+    # 3 > 2 = 2 = 2 > 1 = 1 > 0; ties are ordered by name
+    leaderboard = Leaderboard()
+    leaderboard.load([("eve", 2), ("ana", 3), ("dan", 2), ("ben", 2), ("fay", 1), ("cas", 1), ("gus", 0)])
+    return leaderboard
+
+
+def test_rank_shares_ties():
+    leaderboard = board()
+    assert [leaderboard.rank(name) for name in ("ana", "ben", "dan", "eve", "cas", "fay", "gus")] == [
+        1, 2, 2, 2, 5, 5, 7
+    ]
+    assert leaderboard.rank("nobody") is None
+
+
+def test_rank_follows_updates():
+    leaderboard = board()
+    leaderboard.add("gus", 3)
+    leaderboard.add("ana", 0)
+    assert leaderboard.rank("gus") == 1
+    assert leaderboard.rank("ana") == 1
+    assert leaderboard.rank("ben") == 3
+    leaderboard.add("new", 0)
+    assert leaderboard.rank("new") == 8
+
+
+def test_top_orders_ties_by_name():
+    leaderboard = board()
+    assert leaderboard.top(5) == [
+        ("ana", 3, 1), ("ben", 2, 2), ("dan", 2, 2), ("eve", 2, 2), ("cas", 1, 5)
+    ]
+    assert len(leaderboard.top()) == 7
+    assert leaderboard.top(0) == []
+
+
+def test_around_crosses_tie_groups():
+    leaderboard = board()
+    assert leaderboard.around("eve", 1) == [("dan", 2, 2), ("eve", 2, 2), ("cas", 1, 5)]
+    assert leaderboard.around("ana") == [("ana", 3, 1), ("ben", 2, 2), ("dan", 2, 2)]
+    assert leaderboard.around("gus", 2) == [("cas", 1, 5), ("fay", 1, 5), ("gus", 0, 7)]
+    assert leaderboard.around("nobody") == []
@@ -0,0 +1,166 @@
+"""Every statement the game and analytics routes run must use an index.
+
+The routes are driven through the test client and the SQL they actually
+execute is recorded with set_trace_callback (see conftest.py), so a changed
+or new query is checked without keeping a copy of it here.
+"""
+import re
+
+QUIZ_TITLE = "Query plan test quiz"
+SHELF = {"class_level": "10", "subject": "Science", "book_name": "Plans", "chapter": "Indexes"}
+
+# Statements allowed to walk a whole table or index, by the start of their SQL
+FULL_READS = (
+    # The question catalog is rebuilt with one GROUP BY over the catalog
+    # index, only after the questions changed (catalog.py)
+    "SELECT class_level, subject, book_name, chapter, COUNT(*) FROM questions",
+    # FTS5 loading its one-row config table
+    "SELECT k, v FROM 'main'.",
+)
+
+# Statements that read data; schema changes, PRAGMAs and transaction control are skipped
+CHECKED = re.compile(r"\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+ALIAS = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?(\w+)", re.IGNORECASE)
+
+
+def table_scans(conn, sql):
+    """Plan lines of sql that scan a table or index from end to end.
+
+    Scans of CTEs, subqueries, temp tables and json_each() only walk rows
+    the statement itself produced or was given, so only tables of the main
+    schema count.
+    """
+    tables = {name for (name,) in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'")}
+    aliases = {alias: table for table, alias in ALIAS.findall(sql)}
+    insert = sql.lstrip()[:6].upper() == "INSERT"
+    if insert:
+        # A parent row insert only looks for orphaned child rows while
+        # foreign key violations are outstanding, which the plan can't tell
+        conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    finally:
+        if insert:
+            conn.execute("PRAGMA foreign_keys = ON")
+    scans = []
+    for line in plan:
+        if not line.startswith("SCAN "):
+            continue
+        name = line.split()[1].removeprefix("main.")
+        # A virtual table scan with constraints, e.g. an FTS5 MATCH, is a lookup
+        constrained = "VIRTUAL TABLE INDEX" in line and not line.endswith(":")
+        if aliases.get(name, name) in tables and not constrained:
+            scans.append(line)
+    return scans
+
+
+def check(statements, step, offenders):
+    statements.recording = False
+    seen = set()
+    for conn, sql in statements.take():
+        if sql in seen or not CHECKED.match(sql) or sql.lstrip().startswith(FULL_READS):
+            continue
+        seen.add(sql)
+        for line in table_scans(conn, sql):
+            offenders.append(f"{step}: {line}\n    {' '.join(sql.split())}")
+    statements.recording = True
+
+
+def seed_quiz(sql):
+    quiz_id = sql.execute("INSERT INTO quizzes (title, category) VALUES (?, 'test')", (QUIZ_TITLE,)).lastrowid
+    sql.executemany(
+        "INSERT INTO questions (quiz_id, class_level, subject, book_name, chapter, question, "
+        "option1, option2, option3, option4, correct_answer) VALUES (?, ?, ?, ?, ?, ?, 'a', 'b', 'c', 'd', ?)",
+        [(quiz_id, SHELF["class_level"], SHELF["subject"], SHELF["book_name"], SHELF["chapter"],
+          f"Which index serves lookup number {i}?", "abcd"[i % 4]) for i in range(4)]
+    )
+    sql.commit()
+    question_ids = [row[0] for row in sql.execute("SELECT id FROM questions WHERE quiz_id = ? ORDER BY id", (quiz_id,))]
+    return quiz_id, question_ids
+
+
+def test_routes_use_indexes(app, client, statements, sql):
+    quiz_id, question_ids = seed_quiz(sql)
+    offenders = []
+
+    def call(step, method, url, **kwargs):
+        response = client.open(url, method=method, **kwargs)
+        assert response.status_code < 500, f"{step}: {response.get_data(as_text=True)}"
+        check(statements, step, offenders)
+        return response
+
+    def play():
+        """Run two games of the quiz, pre and post training; returns their PINs"""
+        pins = []
+        for game in ("pre", "post"):
+            pin = call("start_quiz", "POST", "/start_quiz", json={"quiz_id": quiz_id}).get_json()["game_pin"]
+            pins.append(pin)
+            for name in ("ana", "ben", "cas"):
+                call("join_quiz", "POST", "/join_quiz", json={
+                    "playerName": name, "phoneNumber": "1", "emailId": f"{name}@x", "district": "North",
+                    "gamePin": pin
+                })
+            call("get_waiting_participants", "GET", f"/get_waiting_participants?game_pin={pin}")
+            call("check_quiz_status", "GET", f"/check_quiz_status?game_pin={pin}&player_name=ana")
+            call("start_quiz_for_all", "POST", "/start_quiz_for_all", json={"game_pin": pin})
+            call("get_questions", "POST", "/get_questions", json={"game_pin": pin})
+            for index, question_id in enumerate(question_ids):
+                call("move_to_next_question", "POST", "/move_to_next_question",
+                     json={"game_pin": pin, "new_question_index": index})
+                call("check_current_question", "GET", f"/check_current_question?game_pin={pin}")
+                for name, answer in (("ana", "abcd"[index % 4]), ("ben", "a"), ("cas", "b")):
+                    call("submit_answer", "POST", "/submit_answer", json={
+                        "game_pin": pin, "question_id": question_id, "participant": name, "answer": answer
+                    })
+                call("get_question_responses", "POST", "/get_question_responses",
+                     json={"game_pin": pin, "question_id": question_id})
+                call("get_question_responses", "POST", "/get_question_responses",
+                     json={"game_pin": pin, "question_id": question_id, "rows": True})
+            call("get_correct_answers", "POST", "/get_correct_answers",
+                 json={"game_pin": pin, "question_ids": question_ids})
+            call("get_responses", "POST", "/get_responses", json={"game_pin": pin})
+            call("get_responses", "POST", "/get_responses", json={"game_pin": pin, "since_id": 0, "limit": 5})
+            call("get_responses", "POST", "/get_responses", json={"game_pin": pin, "format": "ndjson"})
+            call("leaderboard", "POST", "/leaderboard", json={"game_pin": pin, "top": 2, "participant": "cas"})
+            call("get_scores", "POST", "/get_scores", json={"game_pin": pin})
+            call("performance_analysis", "POST", "/performance_analysis", json={"game_pin": pin})
+            call("most_incorrect_questions", "POST", "/most_incorrect_questions", json={"game_pin": pin})
+            call("quiz_analysis", "POST", "/quiz_analysis", json={"game_pin": pin})
+            call("game_report", "POST", "/game_report", json={"game_pin": pin})
+            call("end_quiz", "POST", "/end_quiz", json={"game_pin": pin})
+        return pins
+
+    pre_pin, post_pin = play()
+    call("get_correct_answers", "POST", "/get_correct_answers", json={"question_ids": question_ids})
+    call("get_quiz_questions", "POST", "/get_quiz_questions", json={"quiz_id": quiz_id})
+    call("compare_training", "GET", f"/compare_training?pre_pin={pre_pin}&post_pin={post_pin}")
+    call("compare_training", "POST", "/compare_training", json={
+        "pairs": [{"pre_pin": pre_pin, "post_pin": post_pin}], "include_participants": True
+    })
+    call("item_analysis", "GET", f"/item_analysis?game_pin={pre_pin}")
+    call("item_analysis", "GET", f"/item_analysis?quiz_id={quiz_id}")
+    call("district_analytics", "GET", "/district_analytics?district=North")
+    call("district_analytics", "GET", f"/district_analytics?quiz_id={quiz_id}&date_from=2020-01-01&date_to=2099-12-31")
+    call("district_analytics", "GET", "/district_analytics?group_by=district&date_from=2020-01-01")
+    call("add_question", "POST", "/add_question", json={
+        **SHELF, "quiz_id": quiz_id, "question": "Which index serves lookup number 0?",
+        "option1": "a", "option2": "b", "option3": "c", "option4": "d", "correct_answer": "a"
+    })
+    call("search_questions", "POST", "/search_questions", json={"q": "index lookup", **SHELF})
+    call("search_questions", "POST", "/search_questions", json={"q": "index lookup", "source": "questions"})
+    call("fetch_filtered_questions", "POST", "/fetch_filtered_questions", json=SHELF)
+    call("catalog", "GET", "/catalog")
+    call("get_books", "POST", "/get_books", json=SHELF)
+    call("get_chapters", "POST", "/get_chapters", json=SHELF)
+    call("get_books_and_chapters", "GET",
+         f"/get_books_and_chapters?class_level={SHELF['class_level']}&subject={SHELF['subject']}")
+
+    # A restarted process rebuilds games and answer keys from SQLite
+    app.games._games.clear()
+    app.answer_keys._keys.clear()
+    for pin in (pre_pin, post_pin):
+        call("check_quiz_status (rebuild)", "GET", f"/check_quiz_status?game_pin={pin}&player_name=ana")
+        call("get_correct_answers (reload)", "POST", "/get_correct_answers",
+             json={"game_pin": pin, "question_ids": question_ids})
+
+    assert not offenders, "Full table scans:\n" + "\n".join(offenders)